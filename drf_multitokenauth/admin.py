@@ -1,8 +1,111 @@
 """ contains basic admin views for MultiToken """
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _, ngettext
+
 from drf_multitokenauth.models import MultiToken
+from drf_multitokenauth.services import revoke_tokens
+
+
+def get_estimated_count(queryset):
+    """ returns the number of rows of the queryset's table according to the table statistics, or None """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+                [table]
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+
+    return int(row[0]) if row and row[0] is not None else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator which uses the table statistics instead of COUNT(*) for unfiltered lists of large tables
+
+    Filtered lists, and tables with less than estimate_threshold rows, are counted exactly.
+    """
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = get_estimated_count(self.object_list)
+            if estimate is not None and estimate >= self.estimate_threshold:
+                return estimate
+        return super(EstimatedCountPaginator, self).count
 
 
 @admin.register(MultiToken)
 class MultiTokenAdmin(admin.ModelAdmin):
-    list_display = ('user', 'name', 'key', 'user_agent')
+    list_display = ('user', 'name', 'key', 'get_user_agent', 'created', 'last_used')
+    list_select_related = ('user',)
+    list_filter = ('created',)
+    search_fields = ('key',)
+    search_help_text = _('Exact token key, or user id')
+    raw_id_fields = ('user', 'user_agent_ref')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['revoke_selected', 'revoke_all_for_users']
+
+    # columns loaded for the list (the user is joined)
+    list_fields = (
+        'id', 'key', 'name', 'created', 'last_used', 'user', 'user_agent', 'user_agent_ref', 'last_known_ip',
+    )
+
+    def get_queryset(self, request):
+        queryset = super(MultiTokenAdmin, self).get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            queryset = queryset.only(*self.list_fields)
+        return queryset
+
+    def get_actions(self, request):
+        actions = super(MultiTokenAdmin, self).get_actions(request)
+        # deletes tokens one by one; revoke_selected does the same with a single query
+        actions.pop('delete_selected', None)
+        return actions
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        finds tokens by their exact key (using its digest if configured via AUTH_TOKEN_KEY_STORAGE), or by user id
+
+        Only lookups which can use an index are supported.
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        results = queryset.filter_key(search_term)
+        if search_term.isdigit():
+            results = results | queryset.filter(user_id=int(search_term))
+        return results, False
+
+    @admin.display(description=_('HTTP User Agent'))
+    def get_user_agent(self, obj):
+        return obj.get_user_agent()
+
+    @admin.action(description=_('Revoke selected tokens'), permissions=['delete'])
+    def revoke_selected(self, request, queryset):
+        revoked = revoke_tokens(queryset=queryset)
+        self.message_user(request, ngettext(
+            'Revoked %d token.', 'Revoked %d tokens.', revoked
+        ) % revoked, messages.SUCCESS)
+
+    @admin.action(description=_('Revoke all tokens of the users of the selected tokens'), permissions=['delete'])
+    def revoke_all_for_users(self, request, queryset):
+        # evaluated, as MySQL can't delete from a table which is used in a subquery
+        user_ids = list(queryset.order_by().values_list('user_id', flat=True).distinct())
+        revoked = revoke_tokens(queryset=MultiToken.objects.filter(user_id__in=user_ids))
+        self.message_user(request, ngettext(
+            'Revoked %d token.', 'Revoked %d tokens.', revoked
+        ) % revoked, messages.SUCCESS)
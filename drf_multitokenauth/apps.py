@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class MultiTokenAuthConfig(AppConfig):
+    name = 'drf_multitokenauth'
+
+    def ready(self):
+        # connect the receivers which keep the token cache in sync
+        from drf_multitokenauth import receivers  # noqa: F401
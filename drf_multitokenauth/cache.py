@@ -0,0 +1,839 @@
+"""
+Token cache used by CachedMultiTokenAuthentication, based on the django cache framework
+
+Optionally, a small per-process LRU cache (L1) is kept in front of the django cache (L2).
+Functions prefixed with "a" are the asyncio counterparts, using the async django cache API.
+"""
+import asyncio
+import hashlib
+import math
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from drf_multitokenauth.instrumentation import get_instrumentation
+
+__all__ = [
+    'LocalTokenCache',
+    'local_token_cache',
+    'get_token_cache',
+    'get_cache_key',
+    'bump_generation',
+    'get_cached_credentials',
+    'get_or_load_credentials',
+    'aget_or_load_credentials',
+    'set_cached_credentials',
+    'invalidate_tokens',
+    'invalidate_revoked_tokens',
+    'invalidate_users',
+    'invalidate_now_and_on_commit',
+    'is_revoked_token',
+    'ais_revoked_token',
+    'is_invalid_token',
+    'ais_invalid_token',
+    'remember_invalid_token',
+    'aremember_invalid_token',
+    'forget_invalid_tokens',
+    'reset_invalid_tokens',
+    'remember_rotated_token',
+    'get_rotated_token_id',
+    'aget_rotated_token_id',
+    'get_rotated_token_ids',
+]
+
+
+def get_token_cache():
+    """ returns the django cache configured via AUTH_TOKEN_CACHE_ALIAS """
+    return caches[getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', 'default')]
+
+
+def get_cache_timeout():
+    """ returns the timeout (in seconds) of cached tokens, configured via AUTH_TOKEN_CACHE_TIMEOUT """
+    return getattr(settings, 'AUTH_TOKEN_CACHE_TIMEOUT', 300)
+
+
+def get_lock_timeout():
+    """ returns the timeout (in seconds) of the lock which coalesces cache misses across processes """
+    return getattr(settings, 'AUTH_TOKEN_CACHE_LOCK_TIMEOUT', 0)
+
+
+def get_early_refresh_beta():
+    """ returns the factor for probabilistic early refreshes of cached tokens (0 disables early refreshes) """
+    return getattr(settings, 'AUTH_TOKEN_CACHE_EARLY_REFRESH_BETA', 1.0)
+
+
+def get_negative_cache_timeout():
+    """ returns the timeout (in seconds) of cached invalid keys, configured via AUTH_TOKEN_NEGATIVE_CACHE_TIMEOUT """
+    return getattr(settings, 'AUTH_TOKEN_NEGATIVE_CACHE_TIMEOUT', 0)
+
+
+def get_rotation_grace_period():
+    """ returns the time (in seconds) rotated keys remain valid, configured via AUTH_TOKEN_ROTATION_GRACE_PERIOD """
+    return getattr(settings, 'AUTH_TOKEN_ROTATION_GRACE_PERIOD', 60)
+
+
+def get_revocation_timeout():
+    """ returns the time (in seconds) revoked keys are remembered, configured via AUTH_TOKEN_REVOCATION_TIMEOUT """
+    return getattr(settings, 'AUTH_TOKEN_REVOCATION_TIMEOUT', 60)
+
+
+def get_cache_key_prefix():
+    return getattr(settings, 'AUTH_TOKEN_CACHE_KEY_PREFIX', 'drf_multitokenauth')
+
+
+def get_key_hash(key):
+    """
+    returns the hex encoded sha256 digest of a token key
+
+    Instead of the key, its digest as stored in MultiToken.digest (bytes) can be passed.
+    """
+    if isinstance(key, (bytes, memoryview)):
+        return bytes(key).hex()
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_cache_key(key):
+    """ returns the cache key for a token key (or digest); the raw token key never ends up in the cache """
+    return '{}:token:{}'.format(get_cache_key_prefix(), get_key_hash(key))
+
+
+def get_revoked_cache_key(cache_key):
+    """ returns the cache key which marks the token of a cache key (see get_cache_key) as revoked """
+    return cache_key + ':revoked'
+
+
+def get_negative_cache_key(key):
+    """ returns the cache key which marks a token key as invalid """
+    return '{}:invalid:{}'.format(get_cache_key_prefix(), get_key_hash(key))
+
+
+def get_rotated_cache_key(key):
+    """ returns the cache key which maps a rotated token key to the id of its token """
+    return '{}:rotated:{}'.format(get_cache_key_prefix(), get_key_hash(key))
+
+
+def get_token_rotations_cache_key(token_id):
+    """ returns the cache key which lists the digests of a token's rotated keys that are within their grace period """
+    return '{}:rotations:{}'.format(get_cache_key_prefix(), token_id)
+
+
+def get_negative_generation_cache_key():
+    """ returns the cache key of the generation of invalid keys, which is bumped to reset all of them at once """
+    return '{}:invalid-generation'.format(get_cache_key_prefix())
+
+
+def get_user_generation_cache_key(user_id):
+    """ returns the cache key of the generation of a user's tokens, which is changed to invalidate all of them """
+    return '{}:user:{}:generation'.format(get_cache_key_prefix(), user_id)
+
+
+def get_generation_cache_key():
+    """ returns the cache key of the generation marker, which is bumped on every revocation """
+    return '{}:generation'.format(get_cache_key_prefix())
+
+
+class LocalTokenCache:
+    """
+    Bounded, thread safe LRU cache of authenticated tokens, living in the memory of the current process
+
+    Entries expire after AUTH_TOKEN_LOCAL_CACHE_TIMEOUT seconds. Within the same interval, the generation marker in the
+    django cache is checked, and all entries are dropped if another process has revoked a token in the meantime.
+
+    Cached credentials are shared between requests and must not be modified.
+    """
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._generation_checked_at = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_entries(self):
+        return getattr(settings, 'AUTH_TOKEN_LOCAL_CACHE_MAX_ENTRIES', 0)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'AUTH_TOKEN_LOCAL_CACHE_TIMEOUT', 5)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, cache_key):
+        """ returns the cached credentials for the given cache key, or None """
+        now = time.monotonic()
+        if self._needs_generation_check(now):
+            self._update_generation(get_token_cache().get(get_generation_cache_key(), 0), now)
+        return self._get(cache_key, now)
+
+    async def aget(self, cache_key):
+        now = time.monotonic()
+        if self._needs_generation_check(now):
+            self._update_generation(await get_token_cache().aget(get_generation_cache_key(), 0), now)
+        return self._get(cache_key, now)
+
+    def _get(self, cache_key, now):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[cache_key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, cache_key, credentials):
+        """ stores credentials, evicting the least recently used entries if the cache is full """
+        max_entries = self.max_entries
+        expires_at = time.monotonic() + self.timeout
+
+        with self._lock:
+            self._entries[cache_key] = (expires_at, credentials)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete_many(self, cache_keys):
+        with self._lock:
+            for cache_key in cache_keys:
+                self._entries.pop(cache_key, None)
+
+    def delete_users(self, user_ids):
+        """ drops all entries of the given users """
+        user_ids = set(user_ids)
+        with self._lock:
+            for cache_key, (expires_at, credentials) in list(self._entries.items()):
+                if credentials[0].pk in user_ids:
+                    del self._entries[cache_key]
+
+    def clear(self):
+        """ drops all entries and resets the counters """
+        with self._lock:
+            self._entries.clear()
+            self._generation = None
+            self._generation_checked_at = None
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """ returns the hit, miss and eviction counters and the current size of the cache """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+        }
+
+    def _needs_generation_check(self, now):
+        checked_at = self._generation_checked_at
+        return checked_at is None or now - checked_at >= self.timeout
+
+    def _update_generation(self, generation, now):
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+            self._generation_checked_at = now
+
+
+# the L1 cache of this process
+local_token_cache = LocalTokenCache()
+
+
+def increment(cache_key, timeout=None):
+    """ atomically increments a counter in the token cache, creating it (with the given timeout) if necessary """
+    cache = get_token_cache()
+    try:
+        return cache.incr(cache_key)
+    except ValueError:
+        # the counter does not exist yet (or has been evicted)
+        if cache.add(cache_key, 1, timeout):
+            return 1
+        return cache.incr(cache_key)
+
+
+def bump_generation():
+    """ bumps the generation marker, telling other processes to drop their L1 cache """
+    increment(get_generation_cache_key())
+
+
+# the tolerated clock difference between processes when comparing generations to load times, in nanoseconds
+GENERATION_CLOCK_TOLERANCE = 10 ** 9
+
+
+def new_user_generation():
+    # a new generation must differ from all previous ones, even if they have been evicted; it is the time of the change
+    return time.time_ns()
+
+
+def get_user_generation(user_id):
+    """ returns the current generation of a user's tokens, creating it if necessary """
+    cache = get_token_cache()
+    cache_key = get_user_generation_cache_key(user_id)
+    generation = cache.get(cache_key)
+    if generation is None:
+        # negative, as the generation has been created, not changed (see has_changed_since)
+        generation = -new_user_generation()
+        if not cache.add(cache_key, generation, None):
+            generation = cache.get(cache_key)
+    return generation
+
+
+async def aget_user_generation(user_id):
+    cache = get_token_cache()
+    cache_key = get_user_generation_cache_key(user_id)
+    generation = await cache.aget(cache_key)
+    if generation is None:
+        generation = -new_user_generation()
+        if not await cache.aadd(cache_key, generation, None):
+            generation = await cache.aget(cache_key)
+    return generation
+
+
+def has_changed_since(generation, loaded_since):
+    """
+    returns whether a user's generation has been changed (e.g. by a revocation) shortly before or after loading started
+    at loaded_since
+
+    The generation can only be read once the token (and its user) has been loaded, so it is compared to the time the
+    load started instead: credentials loaded before a concurrent revocation must not be cached with its generation.
+    Changes within AUTH_TOKEN_REVOCATION_TIMEOUT before the load count as well, as the load might have read from a
+    lagging read replica.
+    """
+    if loaded_since is None:
+        return False
+    tolerance = max(GENERATION_CLOCK_TOLERANCE, get_revocation_timeout() * 10 ** 9)
+    return generation > loaded_since - tolerance
+
+
+def is_current(entry):
+    """ returns whether a cache entry exists and has been stored with the current generation of its user's tokens """
+    return entry is not None and entry[3] == get_user_generation(entry[0][0].pk)
+
+
+async def ais_current(entry):
+    return entry is not None and entry[3] == await aget_user_generation(entry[0][0].pk)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within the current process
+
+    The first caller (leader) executes the function, all other callers wait for its result (or exception).
+    """
+    class Call:
+        __slots__ = ('event', 'result', 'error')
+
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, stale=None):
+        """
+        calls func, unless a call for the same key is already in flight
+
+        If stale is given, callers do not wait for an in-flight call, but return stale immediately.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self.Call()
+
+        if not leader:
+            if stale is not None:
+                return stale
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+single_flight = SingleFlight()
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent calls for the same key within the current event loop (asyncio counterpart of SingleFlight)
+    """
+    def __init__(self):
+        self._futures = weakref.WeakKeyDictionary()
+
+    async def do(self, key, func, stale=None):
+        """ awaits func(), unless a call for the same key is already in flight """
+        loop = asyncio.get_running_loop()
+        futures = self._futures.setdefault(loop, {})
+
+        future = futures.get(key)
+        if future is not None:
+            if stale is not None:
+                return stale
+            return await asyncio.shield(future)
+
+        future = futures[key] = loop.create_future()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # mark the exception as retrieved, in case nobody is waiting for it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del futures[key]
+
+
+async_single_flight = AsyncSingleFlight()
+
+
+def should_refresh_early(delta, expires_at):
+    """
+    decides whether a cached entry is refreshed before it expires ("XFetch")
+
+    The closer an entry is to its expiry and the longer it took to compute (delta), the more likely it is refreshed,
+    so hot entries are renewed by a single request instead of expiring for all requests at once.
+    """
+    beta = get_early_refresh_beta()
+    if beta <= 0:
+        return False
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+
+def store_credentials(cache_key, credentials, delta=0.0, loaded_since=None):
+    """
+    stores credentials together with their load time (delta), expiry and the generation of the user's tokens
+
+    If the generation has changed since loading the credentials started (loaded_since, see time.time_ns), or the token
+    has been revoked recently, they might be stale and are not stored.
+    """
+    cache = get_token_cache()
+    timeout = get_cache_timeout()
+    user_id = credentials[0].pk
+    generation_key = get_user_generation_cache_key(user_id)
+    revoked_key = get_revoked_cache_key(cache_key)
+
+    with get_instrumentation().timer('token_cache_set'):
+        values = cache.get_many([generation_key, revoked_key])
+        if revoked_key in values:
+            return
+        generation = values.get(generation_key)
+        if generation is None:
+            generation = get_user_generation(user_id)
+        if has_changed_since(generation, loaded_since):
+            return
+        cache.set(cache_key, (credentials, delta, time.time() + timeout, generation), timeout)
+
+    if local_token_cache.enabled:
+        local_token_cache.set(cache_key, credentials)
+
+
+def load_credentials(cache_key, loader):
+    """ calls loader and stores its result in the cache """
+    loaded_since = time.time_ns()
+    started_at = time.monotonic()
+    credentials = loader()
+    store_credentials(cache_key, credentials, time.monotonic() - started_at, loaded_since)
+    return credentials
+
+
+def wait_for_credentials(cache_key, lock_key, timeout):
+    """ waits for the holder of lock_key to store the credentials; returns None if it did not """
+    cache = get_token_cache()
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        values = cache.get_many([cache_key, lock_key])
+        # entries of revoked users are left in the cache
+        if is_current(values.get(cache_key)):
+            return values[cache_key][0]
+        if lock_key not in values:
+            # the lock holder failed (e.g. invalid token)
+            return None
+    return None
+
+
+def load_credentials_locked(cache_key, loader, stale):
+    """ loads credentials, making sure only one process at a time loads the same token (if enabled) """
+    lock_timeout = get_lock_timeout()
+    if not lock_timeout:
+        return load_credentials(cache_key, loader)
+
+    cache = get_token_cache()
+    lock_key = cache_key + ':lock'
+
+    if not cache.add(lock_key, 1, lock_timeout):
+        # another process is loading this token
+        if stale is not None:
+            return stale
+        credentials = wait_for_credentials(cache_key, lock_key, lock_timeout)
+        if credentials is not None:
+            return credentials
+        return load_credentials(cache_key, loader)
+
+    try:
+        return load_credentials(cache_key, loader)
+    finally:
+        cache.delete(lock_key)
+
+
+def get_or_load_credentials(key, loader):
+    """
+    returns the cached (user, token) tuple for the given token key, calling loader on a cache miss
+
+    Concurrent misses for the same key are coalesced, and entries close to their expiry are refreshed early.
+    """
+    cache_key = get_cache_key(key)
+    instrumentation = get_instrumentation()
+
+    if local_token_cache.enabled:
+        credentials = local_token_cache.get(cache_key)
+        if credentials is not None:
+            instrumentation.increment('token_cache', result='local_hit')
+            return credentials
+
+    stale = None
+    with instrumentation.timer('token_cache_get'):
+        entry = get_token_cache().get(cache_key)
+        valid = is_current(entry)
+    if valid:
+        credentials, delta, expires_at, generation = entry
+        if not should_refresh_early(delta, expires_at):
+            instrumentation.increment('token_cache', result='hit')
+            if local_token_cache.enabled:
+                local_token_cache.set(cache_key, credentials)
+            return credentials
+        stale = credentials
+
+    instrumentation.increment('token_cache', result='miss' if stale is None else 'refresh')
+    return single_flight.do(cache_key, lambda: load_credentials_locked(cache_key, loader, stale), stale)
+
+
+async def astore_credentials(cache_key, credentials, delta=0.0, loaded_since=None):
+    cache = get_token_cache()
+    timeout = get_cache_timeout()
+    user_id = credentials[0].pk
+    generation_key = get_user_generation_cache_key(user_id)
+    revoked_key = get_revoked_cache_key(cache_key)
+
+    with get_instrumentation().timer('token_cache_set'):
+        values = await cache.aget_many([generation_key, revoked_key])
+        if revoked_key in values:
+            return
+        generation = values.get(generation_key)
+        if generation is None:
+            generation = await aget_user_generation(user_id)
+        if has_changed_since(generation, loaded_since):
+            return
+        await cache.aset(cache_key, (credentials, delta, time.time() + timeout, generation), timeout)
+
+    if local_token_cache.enabled:
+        local_token_cache.set(cache_key, credentials)
+
+
+async def aload_credentials(cache_key, loader):
+    loaded_since = time.time_ns()
+    started_at = time.monotonic()
+    credentials = await loader()
+    await astore_credentials(cache_key, credentials, time.monotonic() - started_at, loaded_since)
+    return credentials
+
+
+async def await_credentials(cache_key, lock_key, timeout):
+    cache = get_token_cache()
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        values = await cache.aget_many([cache_key, lock_key])
+        if await ais_current(values.get(cache_key)):
+            return values[cache_key][0]
+        if lock_key not in values:
+            return None
+    return None
+
+
+async def aload_credentials_locked(cache_key, loader, stale):
+    lock_timeout = get_lock_timeout()
+    if not lock_timeout:
+        return await aload_credentials(cache_key, loader)
+
+    cache = get_token_cache()
+    lock_key = cache_key + ':lock'
+
+    if not await cache.aadd(lock_key, 1, lock_timeout):
+        if stale is not None:
+            return stale
+        credentials = await await_credentials(cache_key, lock_key, lock_timeout)
+        if credentials is not None:
+            return credentials
+        return await aload_credentials(cache_key, loader)
+
+    try:
+        return await aload_credentials(cache_key, loader)
+    finally:
+        await cache.adelete(lock_key)
+
+
+async def aget_or_load_credentials(key, loader):
+    """ asyncio counterpart of get_or_load_credentials; loader is a coroutine function """
+    cache_key = get_cache_key(key)
+    instrumentation = get_instrumentation()
+
+    if local_token_cache.enabled:
+        credentials = await local_token_cache.aget(cache_key)
+        if credentials is not None:
+            instrumentation.increment('token_cache', result='local_hit')
+            return credentials
+
+    stale = None
+    with instrumentation.timer('token_cache_get'):
+        entry = await get_token_cache().aget(cache_key)
+        valid = await ais_current(entry)
+    if valid:
+        credentials, delta, expires_at, generation = entry
+        if not should_refresh_early(delta, expires_at):
+            instrumentation.increment('token_cache', result='hit')
+            if local_token_cache.enabled:
+                local_token_cache.set(cache_key, credentials)
+            return credentials
+        stale = credentials
+
+    instrumentation.increment('token_cache', result='miss' if stale is None else 'refresh')
+    return await async_single_flight.do(
+        cache_key, lambda: aload_credentials_locked(cache_key, loader, stale), stale
+    )
+
+
+def get_cached_credentials(key):
+    """ returns the cached (user, token) tuple for the given token key, or None """
+    cache_key = get_cache_key(key)
+
+    if local_token_cache.enabled:
+        credentials = local_token_cache.get(cache_key)
+        if credentials is not None:
+            return credentials
+
+    entry = get_token_cache().get(cache_key)
+    if not is_current(entry):
+        return None
+
+    if local_token_cache.enabled:
+        local_token_cache.set(cache_key, entry[0])
+    return entry[0]
+
+
+def set_cached_credentials(key, credentials):
+    """ stores the (user, token) tuple for the given token key """
+    store_credentials(get_cache_key(key), credentials)
+
+
+def invalidate_tokens(keys):
+    """ removes the given token keys (or digests) from the cache """
+    cache_keys = [get_cache_key(key) for key in keys if key]
+    if not cache_keys:
+        return
+
+    get_token_cache().delete_many(cache_keys)
+
+    if local_token_cache.enabled:
+        local_token_cache.delete_many(cache_keys)
+        bump_generation()
+
+
+def invalidate_revoked_tokens(keys):
+    """
+    removes the given token keys (or digests) of deleted tokens from the cache, and remembers them as revoked
+
+    For AUTH_TOKEN_REVOCATION_TIMEOUT seconds, revoked keys are not cached again, and not accepted from the read
+    database (see AUTH_TOKEN_READ_DATABASE), as loads which are in progress or read from a lagging replica may still
+    find the deleted token.
+    """
+    cache_keys = [get_cache_key(key) for key in keys if key]
+    timeout = get_revocation_timeout()
+    if cache_keys and timeout:
+        # remembered before the eviction, so concurrent loads can't store the token in between
+        get_token_cache().set_many({get_revoked_cache_key(cache_key): 1 for cache_key in cache_keys}, timeout)
+    invalidate_tokens(keys)
+
+
+def is_revoked_token(key):
+    """ returns True if the given token key has been revoked within AUTH_TOKEN_REVOCATION_TIMEOUT seconds """
+    if not get_revocation_timeout():
+        return False
+    return get_token_cache().get(get_revoked_cache_key(get_cache_key(key))) is not None
+
+
+async def ais_revoked_token(key):
+    if not get_revocation_timeout():
+        return False
+    return await get_token_cache().aget(get_revoked_cache_key(get_cache_key(key))) is not None
+
+
+def invalidate_users(user_ids):
+    """
+    invalidates all cached tokens of the given users, without having to know their keys
+
+    This changes the generation of the users' tokens, so their cache entries are ignored from now on.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+
+    get_token_cache().set_many(
+        {get_user_generation_cache_key(user_id): new_user_generation() for user_id in user_ids}, None
+    )
+
+    if local_token_cache.enabled:
+        local_token_cache.delete_users(user_ids)
+        bump_generation()
+
+
+def invalidate_now_and_on_commit(func, *args, using=None):
+    """
+    calls an invalidation function now and, within a transaction, again after the transaction has been committed
+
+    The second call evicts entries which concurrent requests have loaded before the transaction has been committed.
+    """
+    func(*args)
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(lambda: func(*args), using=using)
+
+
+def is_invalid_token(key):
+    """ returns True if the given token key is known not to exist """
+    if not get_negative_cache_timeout():
+        return False
+
+    negative_key = get_negative_cache_key(key)
+    generation_key = get_negative_generation_cache_key()
+    values = get_token_cache().get_many([negative_key, generation_key])
+    return negative_key in values and values[negative_key] == values.get(generation_key, 0)
+
+
+async def ais_invalid_token(key):
+    if not get_negative_cache_timeout():
+        return False
+
+    negative_key = get_negative_cache_key(key)
+    generation_key = get_negative_generation_cache_key()
+    values = await get_token_cache().aget_many([negative_key, generation_key])
+    return negative_key in values and values[negative_key] == values.get(generation_key, 0)
+
+
+def remember_invalid_token(key):
+    """ marks the given token key as invalid, after it has not been found in the database """
+    timeout = get_negative_cache_timeout()
+    if not timeout:
+        return
+
+    cache = get_token_cache()
+    generation = cache.get(get_negative_generation_cache_key(), 0)
+    cache.set(get_negative_cache_key(key), generation, timeout)
+
+
+async def aremember_invalid_token(key):
+    timeout = get_negative_cache_timeout()
+    if not timeout:
+        return
+
+    cache = get_token_cache()
+    generation = await cache.aget(get_negative_generation_cache_key(), 0)
+    await cache.aset(get_negative_cache_key(key), generation, timeout)
+
+
+def forget_invalid_tokens(keys):
+    """ removes the invalid mark of the given token keys, e.g. after they have been created """
+    if not get_negative_cache_timeout():
+        return
+
+    negative_keys = [get_negative_cache_key(key) for key in keys if key]
+    if negative_keys:
+        get_token_cache().delete_many(negative_keys)
+
+
+def reset_invalid_tokens():
+    """ resets all invalid marks by bumping their generation """
+    increment(get_negative_generation_cache_key())
+
+
+def remember_rotated_token(key, token_id):
+    """ keeps a rotated token key valid for the grace period, by mapping it to the id of its token """
+    timeout = get_rotation_grace_period()
+    if timeout:
+        cache = get_token_cache()
+        rotations_key = get_token_rotations_cache_key(token_id)
+        # the digests of rotated keys are remembered per token, so revocations can end their grace period
+        digests = cache.get(rotations_key, []) + [hashlib.sha256(key.encode()).digest()]
+        cache.set_many({get_rotated_cache_key(key): token_id, rotations_key: digests}, timeout)
+
+
+def forget_rotated_tokens(token_ids):
+    """ ends the grace period of the rotated keys of the given tokens, and evicts them from the cache """
+    if not get_rotation_grace_period():
+        return
+
+    cache = get_token_cache()
+    rotations = cache.get_many([get_token_rotations_cache_key(token_id) for token_id in token_ids])
+    digests = [digest for token_digests in rotations.values() for digest in token_digests]
+    if not digests:
+        return
+
+    cache.delete_many([get_rotated_cache_key(digest) for digest in digests] + list(rotations))
+    invalidate_revoked_tokens(digests)
+
+
+def get_rotated_token_id(key):
+    """ returns the id of the token a rotated key belongs to, or None if the key is not within its grace period """
+    if not get_rotation_grace_period():
+        return None
+    return get_token_cache().get(get_rotated_cache_key(key))
+
+
+async def aget_rotated_token_id(key):
+    if not get_rotation_grace_period():
+        return None
+    return await get_token_cache().aget(get_rotated_cache_key(key))
+
+
+def get_rotated_token_ids(keys):
+    """ returns a dict which maps the given keys that are within their grace period to the ids of their tokens """
+    if not get_rotation_grace_period():
+        return {}
+    keys_by_cache_key = {get_rotated_cache_key(key): key for key in keys}
+    token_ids = get_token_cache().get_many(list(keys_by_cache_key))
+    return {keys_by_cache_key[cache_key]: token_id for cache_key, token_id in token_ids.items()}
@@ -0,0 +1,89 @@
+"""
+Streaming export of tokens (without their keys), used by the export_tokens command and the export view
+"""
+import csv
+import json
+from datetime import datetime, time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from drf_multitokenauth.models import MultiToken
+
+__all__ = [
+    'EXPORT_FORMATS',
+    'EXPORT_COLUMNS',
+    'get_export_queryset',
+    'iter_export_rows',
+    'iter_export',
+    'parse_date_filter',
+]
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+EXPORT_COLUMNS = (
+    'id', 'user_id', 'username', 'name', 'created', 'last_used', 'expires', 'last_known_ip', 'user_agent'
+)
+
+
+def parse_date_filter(value):
+    """ parses a date or datetime (ISO 8601) used to filter exported tokens; raises ValueError if it is invalid """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError('Invalid date: {}'.format(value))
+        parsed = datetime.combine(date, time.min)
+
+    if settings.USE_TZ and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def get_export_queryset(user_id=None, name=None, created_after=None, created_before=None):
+    """ returns the tokens to export, ordered by primary key """
+    queryset = MultiToken.objects.order_by('pk')
+    if user_id is not None:
+        queryset = queryset.filter(user_id=user_id)
+    if name is not None:
+        queryset = queryset.filter(name=name)
+    if created_after is not None:
+        queryset = queryset.filter(created__gte=created_after)
+    if created_before is not None:
+        queryset = queryset.filter(created__lt=created_before)
+    return queryset
+
+
+def iter_export_rows(queryset, chunk_size=2000):
+    """ yields a tuple of the EXPORT_COLUMNS per token, fetching chunk_size tokens at a time """
+    rows = queryset.values_list(
+        'id', 'user_id', 'user__' + get_user_model().USERNAME_FIELD, 'name', 'created', 'last_used', 'expires',
+        'last_known_ip', 'user_agent_ref__value', 'user_agent'
+    ).iterator(chunk_size=chunk_size)
+
+    for row in rows:
+        # the user agent is either normalized or stored inline (see MultiToken.get_user_agent)
+        yield row[:8] + (row[8] if row[8] is not None else row[9],)
+
+
+class Echo:
+    """ file-like object which returns what is written, to stream the output of csv.writer """
+    def write(self, value):
+        return value
+
+
+def iter_export(rows, export_format):
+    """ yields the lines of the export of the given rows, in the given format (csv or jsonl) """
+    if export_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            yield writer.writerow(row)
+    elif export_format == 'jsonl':
+        for row in rows:
+            yield json.dumps(dict(zip(EXPORT_COLUMNS, row)), cls=DjangoJSONEncoder) + '\n'
+    else:
+        raise ValueError('Invalid export format: {}'.format(export_format))
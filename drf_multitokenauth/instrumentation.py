@@ -0,0 +1,149 @@
+"""
+Timers and counters of the authentication hot paths
+
+The instrumentation is configured via AUTH_TOKEN_INSTRUMENTATION, the dotted path of an Instrumentation subclass (e.g.
+'drf_multitokenauth.instrumentation.PrometheusInstrumentation'). By default, nothing is measured.
+
+Timers (in seconds):
+
+* authenticate - authentication of a request by MultiTokenAuthentication (and its subclasses)
+* token_lookup - database lookup of a token
+* token_cache_get, token_cache_set - round trips to the token cache
+* login_password_check - validation of the login credentials (i.e. password hashing)
+* token_insert - creation of a token on login
+* logout_delete - deletion of a token on logout
+* signal_dispatch - sending pre_auth and post_auth (labels: mode)
+
+Counters:
+
+* token_cache - lookups in the token cache (labels: result = local_hit, hit, refresh or miss)
+* logins - login attempts (labels: result = success, invalid or forbidden)
+* signals_dropped - dispatched signals dropped because the queue was full
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+__all__ = [
+    'Instrumentation',
+    'NullInstrumentation',
+    'PrometheusInstrumentation',
+    'get_instrumentation',
+]
+
+
+class Timer:
+    """ context manager which reports the time spent in its block to an instrumentation """
+    __slots__ = ('instrumentation', 'name', 'labels', 'started_at')
+
+    def __init__(self, instrumentation, name, labels):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.observe(self.name, time.perf_counter() - self.started_at, **self.labels)
+
+
+class NullTimer:
+    """ context manager which does nothing """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+null_timer = NullTimer()
+
+
+class Instrumentation:
+    """
+    Receives the timers and counters of the hot paths
+
+    Subclasses implement increment and observe; the names of timers and counters are listed in the module docstring.
+    """
+    def increment(self, name, value=1, **labels):
+        """ increments the counter with the given name """
+
+    def observe(self, name, seconds, **labels):
+        """ records a duration for the timer with the given name """
+
+    def timer(self, name, **labels):
+        """ returns a context manager which observes the time spent in its block """
+        return Timer(self, name, labels)
+
+
+class NullInstrumentation(Instrumentation):
+    """ default instrumentation, which measures nothing """
+    def timer(self, name, **labels):
+        return null_timer
+
+
+class PrometheusInstrumentation(Instrumentation):
+    """
+    Exposes counters and histograms via prometheus_client (pip install drf-multitokenauth[prometheus])
+
+    Metrics are created on first use, named <namespace>_<name>_total (counters) and <namespace>_<name>_seconds
+    (histograms), and registered in the default registry unless another registry is given.
+    """
+    namespace = 'drf_multitokenauth'
+
+    def __init__(self, registry=None):
+        if prometheus_client is None:
+            raise ImproperlyConfigured('PrometheusInstrumentation requires prometheus_client')
+
+        self.registry = registry if registry is not None else prometheus_client.REGISTRY
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def get_metric(self, metric_class, name, labels):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    suffix = 'seconds' if metric_class is prometheus_client.Histogram else ''
+                    metric = self._metrics[name] = metric_class(
+                        name, 'drf_multitokenauth {}'.format(name.replace('_', ' ')), sorted(labels),
+                        namespace=self.namespace, unit=suffix, registry=self.registry
+                    )
+        return metric.labels(**labels) if labels else metric
+
+    def increment(self, name, value=1, **labels):
+        self.get_metric(prometheus_client.Counter, name, labels).inc(value)
+
+    def observe(self, name, seconds, **labels):
+        self.get_metric(prometheus_client.Histogram, name, labels).observe(seconds)
+
+
+null_instrumentation = NullInstrumentation()
+
+# instrumentations by dotted path, instantiated on first use
+_instrumentations = {}
+
+
+def get_instrumentation():
+    """ returns the instrumentation configured via AUTH_TOKEN_INSTRUMENTATION """
+    path = getattr(settings, 'AUTH_TOKEN_INSTRUMENTATION', None)
+    if path is None:
+        return null_instrumentation
+
+    instrumentation = _instrumentations.get(path)
+    if instrumentation is None:
+        instrumentation = _instrumentations.setdefault(path, import_string(path)())
+    return instrumentation
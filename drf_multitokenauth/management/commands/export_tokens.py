@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from drf_multitokenauth.export import (
+    EXPORT_FORMATS, get_export_queryset, iter_export, iter_export_rows, parse_date_filter
+)
+
+
+class Command(BaseCommand):
+    help = 'Exports tokens (without their keys) as CSV or JSON lines, streaming them in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', choices=EXPORT_FORMATS, default='csv',
+            help='Output format (default: csv)'
+        )
+        parser.add_argument(
+            '--output',
+            help='File the export is written to (default: stdout)'
+        )
+        parser.add_argument(
+            '--user-id', type=int,
+            help='Only export the tokens of this user'
+        )
+        parser.add_argument(
+            '--name',
+            help='Only export tokens with this name'
+        )
+        parser.add_argument(
+            '--created-after',
+            help='Only export tokens created at or after this date (ISO 8601)'
+        )
+        parser.add_argument(
+            '--created-before',
+            help='Only export tokens created before this date (ISO 8601)'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Number of tokens fetched from the database at a time (default: 2000)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            created_after, created_before = [
+                parse_date_filter(options[option]) if options[option] else None
+                for option in ('created_after', 'created_before')
+            ]
+        except ValueError as e:
+            raise CommandError(e)
+
+        queryset = get_export_queryset(options['user_id'], options['name'], created_after, created_before)
+        lines = iter_export(iter_export_rows(queryset, options['chunk_size']), options['format'])
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,95 @@
+import json
+import sys
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from drf_multitokenauth.models import MultiToken
+
+
+class Command(BaseCommand):
+    help = 'Issues tokens for many users at once, and writes the created keys as JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Users to issue tokens for'
+        )
+        parser.add_argument(
+            '--usernames-file',
+            help='File with one username per line (use - for stdin)'
+        )
+        parser.add_argument(
+            '--count', type=int, default=1,
+            help='Number of tokens per user (default: 1)'
+        )
+        parser.add_argument(
+            '--name', default='',
+            help='Name of the tokens'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of tokens created per query (default: 1000)'
+        )
+        parser.add_argument(
+            '--prewarm', action='store_true',
+            help='Store the created tokens in the token cache'
+        )
+        parser.add_argument(
+            '--output',
+            help='File the created keys are written to (default: stdout)'
+        )
+
+    def handle(self, *args, **options):
+        tokens = MultiToken.objects.bulk_issue(
+            self.get_users(self.get_usernames(options), options['count'], options['batch_size']),
+            name=options['name'], batch_size=options['batch_size'], prewarm=options['prewarm']
+        )
+
+        output = open(options['output'], 'w') if options['output'] else self.stdout
+        total = 0
+        try:
+            for token in tokens:
+                output.write(json.dumps({
+                    'user_id': token.user_id, 'username': token.user.get_username(), 'name': token.name,
+                    'key': token.key,
+                }) + '\n')
+                total += 1
+        finally:
+            if options['output']:
+                output.close()
+
+        self.stderr.write(self.style.SUCCESS('Issued {} tokens'.format(total)))
+
+    def get_usernames(self, options):
+        yield from options['usernames']
+
+        if options['usernames_file'] == '-':
+            yield from self.read_usernames(sys.stdin)
+        elif options['usernames_file']:
+            with open(options['usernames_file']) as lines:
+                yield from self.read_usernames(lines)
+
+    def read_usernames(self, lines):
+        for line in lines:
+            if line.strip():
+                yield line.strip()
+
+    def get_users(self, usernames, count, batch_size):
+        """ yields the users with the given usernames (count times each), loading them in batches """
+        user_model = get_user_model()
+        usernames = iter(usernames)
+
+        while True:
+            batch = list(islice(usernames, batch_size))
+            if not batch:
+                return
+
+            users = user_model._default_manager.in_bulk(batch, field_name=user_model.USERNAME_FIELD)
+            for username in batch:
+                if username not in users:
+                    self.stderr.write(self.style.WARNING('User {} does not exist'.format(username)))
+                    continue
+                for i in range(count):
+                    yield users[username]
@@ -0,0 +1,65 @@
+import time
+from itertools import islice
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from drf_multitokenauth.cache import forget_invalid_tokens
+from drf_multitokenauth.models import MultiToken
+
+
+class Command(BaseCommand):
+    help = 'Copies the tokens of rest_framework.authtoken to MultiToken in chunks, ordered by key'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of tokens copied per query (default: 1000)'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to sleep between two batches (default: 0)'
+        )
+        parser.add_argument(
+            '--after', default='',
+            help='Only copy tokens whose key is greater than this (e.g. a reported key prefix), to resume an '
+                 'interrupted run'
+        )
+        parser.add_argument(
+            '--name', default='',
+            help='Name of the copied tokens'
+        )
+
+    def handle(self, *args, **options):
+        if not apps.is_installed('rest_framework.authtoken'):
+            raise CommandError('rest_framework.authtoken is not installed')
+
+        from rest_framework.authtoken.models import Token
+
+        batch_size = options['batch_size']
+        legacy_tokens = Token.objects.filter(key__gt=options['after']).order_by('pk').values_list(
+            'key', 'user_id', 'created'
+        ).iterator(chunk_size=batch_size)
+        total = 0
+
+        while True:
+            rows = list(islice(legacy_tokens, batch_size))
+            if not rows:
+                break
+
+            # existing tokens (e.g. from a previous run) are skipped
+            MultiToken.objects.bulk_create([
+                MultiToken(user_id=user_id, created=created, name=options['name'], **MultiToken.get_key_fields(key))
+                for key, user_id, created in rows
+            ], ignore_conflicts=True)
+            # the keys might have been presented (and marked as invalid) before they were copied
+            forget_invalid_tokens([key for key, user_id, created in rows])
+            total += len(rows)
+
+            # only a prefix of the last key is reported, which is sufficient to resume with --after
+            self.stdout.write('Copied {} tokens (last key: {}...)'.format(total, rows[-1][0][:8]))
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS('Copied {} tokens'.format(total)))
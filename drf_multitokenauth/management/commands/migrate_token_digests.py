@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from drf_multitokenauth.models import MultiToken, get_key_storage, hash_key
+
+
+class Command(BaseCommand):
+    help = 'Stores the digest of existing token keys in chunks, ordered by primary key (see AUTH_TOKEN_KEY_STORAGE)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of tokens updated per query (default: 1000)'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to sleep between two batches (default: 0)'
+        )
+        parser.add_argument(
+            '--clear-keys', action='store_true',
+            help='Afterwards, remove the stored keys of all tokens with a digest (requires AUTH_TOKEN_KEY_STORAGE '
+                 '"digest" in all processes)'
+        )
+
+    def handle(self, *args, **options):
+        storage = get_key_storage()
+        if storage == 'plain':
+            raise CommandError('AUTH_TOKEN_KEY_STORAGE needs to be "transition" or "digest"')
+        if options['clear_keys'] and storage != 'digest':
+            raise CommandError('--clear-keys requires AUTH_TOKEN_KEY_STORAGE "digest"')
+
+        batch_size = options['batch_size']
+        last_pk = 0
+        total = 0
+
+        pending = MultiToken.objects.filter(digest__isnull=True, key__isnull=False).order_by('pk')
+        while True:
+            rows = list(pending.filter(pk__gt=last_pk).values_list('pk', 'key')[:batch_size])
+            if not rows:
+                break
+
+            last_pk = rows[-1][0]
+            MultiToken.objects.bulk_update([MultiToken(pk=pk, digest=hash_key(key)) for pk, key in rows], ['digest'])
+            total += len(rows)
+            self.stdout.write('Stored {} digests (last id: {})'.format(total, last_pk))
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS('Stored {} digests'.format(total)))
+
+        if options['clear_keys']:
+            self.clear_keys(batch_size, options['sleep'])
+
+    def clear_keys(self, batch_size, sleep):
+        total = 0
+
+        stored = MultiToken.objects.filter(digest__isnull=False, key__isnull=False).order_by('pk')
+        while True:
+            pks = list(stored.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+
+            total += MultiToken.objects.filter(pk__in=pks).update(key=None)
+            self.stdout.write('Removed {} keys (last id: {})'.format(total, pks[-1]))
+
+            if sleep:
+                time.sleep(sleep)
+
+        self.stdout.write(self.style.SUCCESS('Removed {} keys'.format(total)))
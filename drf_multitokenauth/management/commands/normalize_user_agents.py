@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from drf_multitokenauth.models import MultiToken, UserAgent
+
+
+class Command(BaseCommand):
+    help = 'Moves the user agents of existing tokens into the UserAgent table in chunks, ordered by primary key'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of tokens updated per query (default: 1000)'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to sleep between two batches (default: 0)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        total = 0
+
+        pending = MultiToken.objects.filter(user_agent_ref__isnull=True).exclude(user_agent='').order_by('pk')
+        while True:
+            rows = list(pending.filter(pk__gt=last_pk).values_list('pk', 'user_agent')[:batch_size])
+            if not rows:
+                break
+
+            last_pk = rows[-1][0]
+            # distinct user agents are cached, so each of them is only looked up once
+            MultiToken.objects.bulk_update([
+                MultiToken(pk=pk, user_agent_ref_id=UserAgent.objects.intern(user_agent), user_agent='')
+                for pk, user_agent in rows
+            ], ['user_agent_ref', 'user_agent'])
+            total += len(rows)
+            self.stdout.write('Normalized {} user agents (last id: {})'.format(total, last_pk))
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS('Normalized {} user agents'.format(total)))
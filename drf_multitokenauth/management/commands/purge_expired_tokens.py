@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from drf_multitokenauth.cache import forget_rotated_tokens, invalidate_revoked_tokens
+from drf_multitokenauth.models import MultiToken
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired tokens in chunks, ordered by primary key'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of tokens deleted per query (default: 1000)'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to sleep between two batches (default: 0)'
+        )
+        parser.add_argument(
+            '--after', type=int, default=0,
+            help='Only delete tokens with a primary key greater than this, e.g. to resume an interrupted run'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the expired tokens, without deleting them'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        last_pk = options['after']
+        total = 0
+
+        # use the same point in time for all batches
+        expired = MultiToken.objects.expired().order_by('pk')
+
+        while True:
+            rows = list(expired.filter(pk__gt=last_pk).values_list('pk', 'key', 'digest')[:batch_size])
+            if not rows:
+                break
+
+            last_pk = rows[-1][0]
+            if dry_run:
+                total += len(rows)
+            else:
+                total += MultiToken.objects.filter(pk__in=[pk for pk, key, digest in rows]).delete_without_signals()
+                invalidate_revoked_tokens([key or digest for pk, key, digest in rows])
+                forget_rotated_tokens([pk for pk, key, digest in rows])
+
+            self.stdout.write('{} {} expired tokens (last id: {})'.format(
+                'Found' if dry_run else 'Deleted', total, last_pk
+            ))
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS('{} {} expired tokens'.format(
+            'Found' if dry_run else 'Deleted', total
+        )))
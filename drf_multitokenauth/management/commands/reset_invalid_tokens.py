@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from drf_multitokenauth.cache import get_negative_cache_timeout, reset_invalid_tokens
+
+
+class Command(BaseCommand):
+    help = 'Resets the negative token cache, i.e. forgets all token keys which are known not to exist'
+
+    def handle(self, *args, **options):
+        if not get_negative_cache_timeout():
+            self.stdout.write('The negative token cache is disabled (AUTH_TOKEN_NEGATIVE_CACHE_TIMEOUT)')
+            return
+
+        reset_invalid_tokens()
+        self.stdout.write(self.style.SUCCESS('Reset the negative token cache'))
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_multitokenauth', '0004_multitoken_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='multitoken',
+            name='last_used',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Last used'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_multitokenauth', '0005_multitoken_last_used'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='multitoken',
+            name='expires',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Expires'),
+        ),
+    ]
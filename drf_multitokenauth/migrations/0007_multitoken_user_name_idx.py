@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_multitokenauth', '0006_multitoken_expires'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='multitoken',
+            index=models.Index(fields=['user', 'name'], name='multitoken_user_name_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+import drf_multitokenauth.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_multitokenauth', '0007_multitoken_user_name_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='multitoken',
+            name='digest',
+            field=drf_multitokenauth.models.DigestField(max_length=32, null=True, unique=True, verbose_name='Key digest'),
+        ),
+        migrations.AlterField(
+            model_name='multitoken',
+            name='key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Key'),
+        ),
+    ]
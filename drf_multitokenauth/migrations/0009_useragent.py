@@ -0,0 +1,37 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_multitokenauth', '0008_multitoken_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('value', models.CharField(max_length=256, unique=True, verbose_name='HTTP User Agent')),
+            ],
+            options={
+                'verbose_name': 'User agent',
+                'verbose_name_plural': 'User agents',
+                'abstract': False,
+            },
+        ),
+        migrations.AlterField(
+            model_name='multitoken',
+            name='user_agent',
+            field=models.CharField(blank=True, default='', max_length=256, verbose_name='HTTP User Agent'),
+        ),
+        migrations.AddField(
+            model_name='multitoken',
+            name='user_agent_ref',
+            field=models.ForeignKey(
+                blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+',
+                to='drf_multitokenauth.useragent', verbose_name='Normalized HTTP User Agent'
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_multitokenauth', '0009_useragent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='multitoken',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Created'),
+        ),
+    ]
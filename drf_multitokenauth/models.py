@@ -1,12 +1,21 @@
 import binascii
+import hashlib
 import os
+from datetime import timedelta
 
 from django.conf import settings
-from django.db import models
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models, router, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from drf_multitokenauth.cache import forget_invalid_tokens, set_cached_credentials
+
 __all__ = [
+    'LazyMultiToken',
     'MultiToken',
+    'UserAgent',
 ]
 
 # Prior to Django 1.5, the AUTH_USER_MODEL setting does not exist.
@@ -16,6 +25,340 @@ __all__ = [
 AUTH_USER_MODEL = getattr(settings, 'AUTH_USER_MODEL', 'auth.User')
 
 
+KEY_STORAGE_MODES = ('plain', 'transition', 'digest')
+
+
+def get_key_storage():
+    """
+    returns how token keys are stored, configured via AUTH_TOKEN_KEY_STORAGE
+
+    * plain: only the key is stored (default)
+    * transition: the key and its digest are stored, and tokens are looked up by either of them
+    * digest: only the digest of the key is stored, and tokens are looked up by it
+    """
+    storage = getattr(settings, 'AUTH_TOKEN_KEY_STORAGE', 'plain')
+    if storage not in KEY_STORAGE_MODES:
+        raise ImproperlyConfigured('AUTH_TOKEN_KEY_STORAGE must be one of {}'.format(', '.join(KEY_STORAGE_MODES)))
+    return storage
+
+
+def hash_key(key):
+    """ returns the (binary) digest which is stored for a token key """
+    return hashlib.sha256(key.encode()).digest()
+
+
+class DigestField(models.BinaryField):
+    """
+    Fixed-width binary field for key digests
+
+    Uses BINARY/RAW columns on MySQL and Oracle, whose default BLOB columns can't have a unique index.
+    """
+    def db_type(self, connection):
+        if connection.vendor == 'mysql':
+            return 'binary({})'.format(self.max_length)
+        if connection.vendor == 'oracle':
+            return 'RAW({})'.format(self.max_length)
+        return super(DigestField, self).db_type(connection)
+
+
+def get_lean_user_fields(user_model):
+    """
+    returns the user fields which are loaded by the lean token lookup, in the order of the model's concrete fields
+
+    Configurable via AUTH_TOKEN_LEAN_USER_FIELDS; the primary key is always loaded.
+    """
+    field_names = getattr(settings, 'AUTH_TOKEN_LEAN_USER_FIELDS', None)
+    if field_names is None:
+        field_names = ('is_active', user_model.USERNAME_FIELD, 'is_staff', 'is_superuser')
+
+    return [
+        field for field in user_model._meta.concrete_fields
+        if field.primary_key or field.name in field_names or field.attname in field_names
+    ]
+
+
+def is_token_expired(created, last_used, expires, now=None):
+    """
+    returns whether a token has expired
+
+    Tokens expire at their absolute expiry date (expires), or after AUTH_TOKEN_SLIDING_EXPIRY seconds of inactivity.
+    """
+    now = now or timezone.now()
+    if expires is not None and expires <= now:
+        return True
+
+    sliding_expiry = getattr(settings, 'AUTH_TOKEN_SLIDING_EXPIRY', None)
+    if sliding_expiry:
+        return (last_used or created) + timedelta(seconds=sliding_expiry) <= now
+    return False
+
+
+class MultiTokenQuerySet(models.QuerySet):
+    def filter_key(self, key):
+        """ filters the token with the given key, by its key and/or digest depending on AUTH_TOKEN_KEY_STORAGE """
+        return self.filter_keys([key])
+
+    def filter_keys(self, keys):
+        storage = get_key_storage()
+        if storage == 'plain':
+            return self.filter(key__in=keys)
+
+        digests = [hash_key(key) for key in keys]
+        if storage == 'transition':
+            return self.filter(models.Q(digest__in=digests) | models.Q(key__in=keys))
+        return self.filter(digest__in=digests)
+
+    def expired(self, now=None):
+        """ filters tokens which have expired (see is_token_expired) """
+        now = now or timezone.now()
+        condition = models.Q(expires__lte=now)
+
+        sliding_expiry = getattr(settings, 'AUTH_TOKEN_SLIDING_EXPIRY', None)
+        if sliding_expiry:
+            inactive_since = now - timedelta(seconds=sliding_expiry)
+            condition |= models.Q(last_used__lte=inactive_since)
+            condition |= models.Q(last_used__isnull=True, created__lte=inactive_since)
+
+        return self.filter(condition)
+
+    def filter_user_agent(self, user_agent):
+        """ filters tokens with the given user agent, which is either stored inline or in the UserAgent table """
+        user_agent = truncate_user_agent(user_agent)
+        normalized = models.Q(user_agent_ref__value=user_agent)
+        inline = models.Q(user_agent_ref__isnull=True, user_agent=user_agent)
+        return self.filter(normalized | inline)
+
+    @property
+    def write_db(self):
+        """ returns the database which writes of this queryset go to (db is the database for reads) """
+        return self._db or router.db_for_write(self.model, **self._hints)
+
+    def delete_without_signals(self):
+        """
+        deletes the tokens with a single DELETE query, without loading them or sending signals
+
+        Returns the number of deleted tokens. Callers are responsible for evicting the tokens from the token cache.
+        """
+        return self._raw_delete(self.write_db)
+
+
+# token fields loaded by the lean token lookup (besides the key)
+LEAN_TOKEN_FIELDS = ('id', 'user_id', 'created', 'last_used', 'expires')
+
+
+class MultiTokenManager(models.Manager.from_queryset(MultiTokenQuerySet)):
+    def bulk_issue(self, users_or_specs, name='', batch_size=1000, prewarm=False):
+        """
+        creates tokens for many users with batched INSERT queries, and yields the created tokens (with their keys)
+
+        users_or_specs is an iterable of users, or of dicts with the field values of a token (including its user). It is
+        consumed lazily, batch by batch. With prewarm, the created tokens are stored in the token cache. Like
+        bulk_create, no signals are sent.
+        """
+        batch = []
+        for user_or_spec in users_or_specs:
+            batch.append(user_or_spec)
+            if len(batch) >= batch_size:
+                yield from self._bulk_issue(batch, name, prewarm)
+                batch = []
+        if batch:
+            yield from self._bulk_issue(batch, name, prewarm)
+
+    def _bulk_issue(self, batch, name, prewarm):
+        keys = self.model.generate_keys(len(batch))
+        expires = self.model.get_default_expiry()
+
+        tokens = []
+        for key, user_or_spec in zip(keys, batch):
+            spec = dict(user_or_spec) if isinstance(user_or_spec, dict) else {'user': user_or_spec}
+            spec.setdefault('name', name)
+            spec.setdefault('expires', expires)
+            token = self.model(**spec, **self.model.get_key_fields(key))
+            token.normalize_user_agent(using=self.db)
+            tokens.append(token)
+
+        self.bulk_create(tokens)
+        forget_invalid_tokens(keys)
+
+        for key, token in zip(keys, tokens):
+            # the key is not stored with AUTH_TOKEN_KEY_STORAGE = 'digest'
+            token.key = key
+            if prewarm:
+                set_cached_credentials(key, (token.user, token))
+            yield token
+
+    def get_lean(self, key, as_model=False):
+        """
+        returns the token for the given key with a single query, which only loads the columns needed for authentication
+
+        Returns a LazyMultiToken (or, if as_model is set, a MultiToken with deferred fields), whose user only has
+        the fields of get_lean_user_fields loaded. Raises DoesNotExist if there is no such token.
+        """
+        queryset, user_fields = self._get_lean_queryset(key)
+        return self._from_lean_row(queryset.db, key, queryset.get(), user_fields, as_model)
+
+    async def aget_lean(self, key, as_model=False):
+        queryset, user_fields = self._get_lean_queryset(key)
+        return self._from_lean_row(queryset.db, key, await queryset.aget(), user_fields, as_model)
+
+    def _get_lean_queryset(self, key):
+        user_fields = get_lean_user_fields(get_user_model())
+        queryset = self.filter_key(key).values_list(
+            *LEAN_TOKEN_FIELDS, *['user__' + field.attname for field in user_fields]
+        )
+        return queryset, user_fields
+
+    def _from_lean_row(self, db, key, row, user_fields, as_model):
+        token_values = dict(zip(LEAN_TOKEN_FIELDS, row), key=key)
+        user = get_user_model().from_db(
+            db, [field.attname for field in user_fields], row[len(LEAN_TOKEN_FIELDS):]
+        )
+
+        if as_model:
+            # from_db expects the values in the order of the concrete fields
+            attnames = [field.attname for field in self.model._meta.concrete_fields if field.attname in token_values]
+            token = self.model.from_db(db, attnames, [token_values[attname] for attname in attnames])
+            token.user = user
+            return token
+        return LazyMultiToken(user=user, **token_values)
+
+
+class LazyMultiToken:
+    """
+    Compact stand-in for a MultiToken, returned by the lean token lookup
+
+    Only the fields needed for authentication are loaded; any other attribute is loaded from the database on first
+    access.
+    """
+    # digest is not loaded, but can be set (e.g. by rotate_token)
+    __slots__ = ('pk', 'key', 'digest', 'user_id', 'user', 'created', 'last_used', 'expires', '_token')
+
+    def __init__(self, id, key, user_id, user, created, last_used, expires):
+        self.pk = id
+        self.key = key
+        self.user_id = user_id
+        self.user = user
+        self.created = created
+        self.last_used = last_used
+        self.expires = expires
+
+    @property
+    def id(self):
+        return self.pk
+
+    def is_expired(self, now=None):
+        return is_token_expired(self.created, self.last_used, self.expires, now)
+
+    def get_token(self):
+        """ returns the full MultiToken, loading it on first access """
+        try:
+            return self._token
+        except AttributeError:
+            token = MultiToken.objects.get(pk=self.pk)
+            token.user = self.user
+            self._token = token
+            return token
+
+    def __getattr__(self, name):
+        # only called for attributes which are not loaded
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.get_token(), name)
+
+    def __eq__(self, other):
+        if not isinstance(other, (LazyMultiToken, MultiToken)):
+            return NotImplemented
+        return self.pk == other.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __repr__(self):
+        return '<{}: {}>'.format(self.__class__.__name__, self.pk)
+
+
+# the maximum length of stored user agents, longer ones are truncated
+USER_AGENT_MAX_LENGTH = 256
+
+
+def truncate_user_agent(value):
+    """ returns the user agent as it is stored, i.e. truncated to USER_AGENT_MAX_LENGTH characters """
+    return (value or '')[:USER_AGENT_MAX_LENGTH]
+
+
+def is_user_agent_normalized():
+    """
+    returns whether user agents of new tokens are stored in the UserAgent table (AUTH_TOKEN_NORMALIZE_USER_AGENT)
+    """
+    return getattr(settings, 'AUTH_TOKEN_NORMALIZE_USER_AGENT', False)
+
+
+# per-process caches of interned user agents (value -> id and id -> value); user agents are never changed
+user_agent_ids = {}
+user_agent_values = {}
+USER_AGENT_CACHE_MAX_ENTRIES = 10000
+
+
+def remember_user_agent(pk, value):
+    if len(user_agent_ids) >= USER_AGENT_CACHE_MAX_ENTRIES:
+        user_agent_ids.clear()
+        user_agent_values.clear()
+    user_agent_ids[value] = pk
+    user_agent_values[pk] = value
+
+
+class UserAgentManager(models.Manager):
+    def intern(self, value):
+        """ returns the id of the given user agent string, creating it if necessary """
+        try:
+            return user_agent_ids[value]
+        except KeyError:
+            pass
+
+        user_agent, created = self.get_or_create(value=value)
+        if created and transaction.get_connection(self.db).in_atomic_block:
+            # the user agent only exists for other transactions after this one has been committed
+            transaction.on_commit(lambda: remember_user_agent(user_agent.pk, value), using=self.db)
+        else:
+            remember_user_agent(user_agent.pk, value)
+        return user_agent.pk
+
+    def get_value(self, pk):
+        """ returns the user agent string with the given id """
+        try:
+            return user_agent_values[pk]
+        except KeyError:
+            pass
+
+        value = self.filter(pk=pk).values_list('value', flat=True).get()
+        remember_user_agent(pk, value)
+        return value
+
+
+class UserAgent(models.Model):
+    """
+    A distinct HTTP user agent string, referenced by tokens if AUTH_TOKEN_NORMALIZE_USER_AGENT is enabled
+    """
+    id = models.AutoField(
+        primary_key=True
+    )
+    value = models.CharField(
+        _("HTTP User Agent"),
+        max_length=USER_AGENT_MAX_LENGTH,
+        unique=True
+    )
+
+    objects = UserAgentManager()
+
+    class Meta:
+        abstract = 'drf_multitokenauth' not in settings.INSTALLED_APPS
+        verbose_name = _("User agent")
+        verbose_name_plural = _("User agents")
+
+    def __str__(self):
+        return self.value
+
+
 class MultiToken(models.Model):
     """
     The multi token model with user agent and IP address.
@@ -28,8 +371,15 @@ class MultiToken(models.Model):
     key = models.CharField(
         _("Key"),
         max_length=64,
-        db_index=True,
-        unique=True
+        unique=True,
+        null=True,
+        blank=True
+    )
+    digest = DigestField(
+        _("Key digest"),
+        max_length=32,
+        unique=True,
+        null=True
     )
     user = models.ForeignKey(
         AUTH_USER_MODEL,
@@ -37,18 +387,41 @@ class MultiToken(models.Model):
         on_delete=models.CASCADE,
         verbose_name=_("User")
     )
+    # not auto_now_add, so that the creation date of migrated tokens can be kept
     created = models.DateTimeField(
         _("Created"),
-        auto_now_add=True
+        default=timezone.now,
+        editable=False
+    )
+    last_used = models.DateTimeField(
+        _("Last used"),
+        null=True,
+        blank=True
+    )
+    expires = models.DateTimeField(
+        _("Expires"),
+        null=True,
+        blank=True
     )
     last_known_ip = models.GenericIPAddressField(
         _("The IP address of this session"),
         default="127.0.0.1"
     )
+    # the user agent is stored either inline, or (with AUTH_TOKEN_NORMALIZE_USER_AGENT) in the UserAgent table;
+    # use get_user_agent to read it
     user_agent = models.CharField(
-        max_length=256,
+        max_length=USER_AGENT_MAX_LENGTH,
         verbose_name=_("HTTP User Agent"),
-        default=""
+        default="",
+        blank=True
+    )
+    user_agent_ref = models.ForeignKey(
+        'drf_multitokenauth.UserAgent',
+        related_name='+',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        verbose_name=_("Normalized HTTP User Agent")
     )
     name = models.CharField(
         max_length=256,
@@ -56,6 +429,8 @@ class MultiToken(models.Model):
         default=""
     )
 
+    objects = MultiTokenManager()
+
     class Meta:
         # Work around for a bug in Django:
         # https://code.djangoproject.com/ticket/19422
@@ -65,18 +440,92 @@ class MultiToken(models.Model):
         abstract = 'drf_multitokenauth' not in settings.INSTALLED_APPS
         verbose_name = _("Token")
         verbose_name_plural = _("Tokens")
+        indexes = [
+            # used when reusing tokens on login
+            models.Index(fields=['user', 'name'], name='multitoken_user_name_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        if not self.key:
+        if not self.key and self.digest is None:
             self.key = self.generate_key()
-        return super(MultiToken, self).save(*args, **kwargs)
+        if self._state.adding and self.expires is None:
+            self.expires = self.get_default_expiry()
+
+        storage = get_key_storage()
+        if self.key and storage != 'plain':
+            self.digest = hash_key(self.key)
+
+        # the user agent remains available on this instance, even if it is only stored in the UserAgent table
+        using = kwargs.get('using') or router.db_for_write(self.__class__, instance=self)
+        user_agent = self.normalize_user_agent(using=using)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'user_agent' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'user_agent_ref'}
+
+        key = self.key
+        if storage == 'digest':
+            # only the digest is stored, but the key remains available on this instance (e.g. to return it on login)
+            self.key = None
+        try:
+            return super(MultiToken, self).save(*args, **kwargs)
+        finally:
+            self.key = key
+            self.user_agent = user_agent
+
+    @staticmethod
+    def get_key_fields(key):
+        """ returns the field values which store the given key, depending on AUTH_TOKEN_KEY_STORAGE """
+        storage = get_key_storage()
+        if storage == 'plain':
+            return {'key': key}
+        return {'key': key if storage == 'transition' else None, 'digest': hash_key(key)}
+
+    @staticmethod
+    def get_default_expiry():
+        """ returns the expiry date of new tokens, configured via AUTH_TOKEN_EXPIRY (in seconds) """
+        expiry = getattr(settings, 'AUTH_TOKEN_EXPIRY', None)
+        if expiry:
+            return timezone.now() + timedelta(seconds=expiry)
+        return None
+
+    def is_expired(self, now=None):
+        return is_token_expired(self.created, self.last_used, self.expires, now)
+
+    def get_user_agent(self):
+        """ returns the user agent, regardless of whether it is stored inline or in the UserAgent table """
+        if self.user_agent_ref_id is not None:
+            return UserAgent.objects.get_value(self.user_agent_ref_id)
+        return self.user_agent
+
+    def normalize_user_agent(self, using=None):
+        """
+        prepares the user agent for being stored: it is truncated and, with AUTH_TOKEN_NORMALIZE_USER_AGENT, moved into
+        the UserAgent table of the given database
+
+        Called by save(); bulk operations call it for each token. Returns the (truncated) user agent.
+        """
+        user_agent = self.user_agent = truncate_user_agent(self.user_agent)
+        if user_agent:
+            if is_user_agent_normalized():
+                self.user_agent_ref_id = UserAgent.objects.db_manager(using).intern(user_agent)
+                self.user_agent = ''
+            else:
+                # the inline user agent replaces a normalized one
+                self.user_agent_ref_id = None
+        return user_agent
 
     @staticmethod
     def generate_key():
         """ generates a pseudo random code using os.urandom and binascii.hexlify """
         return binascii.hexlify(os.urandom(32)).decode()
 
+    @staticmethod
+    def generate_keys(count):
+        """ generates count keys like generate_key, with a single call of os.urandom """
+        data = os.urandom(32 * count)
+        return [binascii.hexlify(data[i:i + 32]).decode() for i in range(0, 32 * count, 32)]
+
     def __str__(self):
         return "{} ({} for user {} with IP {} and user-agent {})".format(
-            self.key, self.name, self.user, self.last_known_ip, self.user_agent
+            self.key, self.name, self.user, self.last_known_ip, self.get_user_agent()
         )
@@ -0,0 +1,41 @@
+"""
+Signal receivers which keep the token cache in sync with the database
+"""
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from drf_multitokenauth.cache import (
+    forget_invalid_tokens, forget_rotated_tokens, invalidate_now_and_on_commit, invalidate_revoked_tokens,
+    invalidate_tokens, invalidate_users
+)
+from drf_multitokenauth.models import MultiToken
+
+# fields of the user model that influence whether a cached token may still be used
+USER_AUTH_FIELDS = frozenset(['password', 'is_active'])
+
+
+@receiver(post_save, sender=MultiToken, dispatch_uid='drf_multitokenauth_token_saved')
+@receiver(post_delete, sender=MultiToken, dispatch_uid='drf_multitokenauth_token_deleted')
+def invalidate_token(sender, instance, created=False, using=None, **kwargs):
+    """ evicts a token from the cache whenever it is changed or deleted """
+    if created:
+        # the key might have been presented (and marked as invalid) before it was created
+        forget_invalid_tokens([instance.key])
+    elif kwargs.get('signal') is post_delete:
+        # with AUTH_TOKEN_KEY_STORAGE = 'digest', tokens loaded from the database only know their digest
+        invalidate_now_and_on_commit(invalidate_revoked_tokens, [instance.key or instance.digest], using=using)
+        forget_rotated_tokens([instance.pk])
+    else:
+        invalidate_now_and_on_commit(invalidate_tokens, [instance.key or instance.digest], using=using)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL, dispatch_uid='drf_multitokenauth_user_saved')
+def invalidate_user_tokens(sender, instance, created=False, update_fields=None, using=None, **kwargs):
+    """ evicts all tokens of a user, e.g. after the user has been deactivated or changed the password """
+    if created:
+        return
+    if update_fields is not None and USER_AUTH_FIELDS.isdisjoint(update_fields):
+        # e.g. update_last_login, which only touches last_login
+        return
+    invalidate_now_and_on_commit(invalidate_users, [instance.pk], using=using)
@@ -1,8 +1,13 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 from rest_framework.authtoken.serializers import AuthTokenSerializer
 
 __all__ = [
     'EmailSerializer',
+    'IntrospectionSerializer',
+    'LogoutAllSerializer',
+    'LogoutSerializer',
 ]
 
 
@@ -12,3 +17,22 @@ class EmailSerializer(serializers.Serializer):
 
 class MultiAuthTokenSerializer(AuthTokenSerializer):
     token_name = serializers.CharField(required=False, default="", allow_blank=True)
+    reuse_token = serializers.BooleanField(required=False, default=False)
+
+
+class LogoutSerializer(serializers.Serializer):
+    names = serializers.ListField(child=serializers.CharField(allow_blank=True), required=False, allow_empty=False)
+
+
+class LogoutAllSerializer(serializers.Serializer):
+    keep_current = serializers.BooleanField(required=False, default=False)
+
+
+class IntrospectionSerializer(serializers.Serializer):
+    keys = serializers.ListField(child=serializers.CharField(max_length=64), allow_empty=False)
+
+    def validate_keys(self, keys):
+        max_batch = getattr(settings, 'AUTH_TOKEN_INTROSPECTION_MAX_BATCH', 100)
+        if len(keys) > max_batch:
+            raise serializers.ValidationError(_('At most {} keys can be checked at once.').format(max_batch))
+        return keys
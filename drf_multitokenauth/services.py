@@ -0,0 +1,256 @@
+"""
+Services for managing tokens outside of the request/response cycle
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from drf_multitokenauth.cache import (
+    forget_rotated_tokens, get_rotated_token_ids, invalidate_now_and_on_commit, invalidate_revoked_tokens,
+    invalidate_tokens, invalidate_users, remember_rotated_token
+)
+from drf_multitokenauth.instrumentation import get_instrumentation
+from drf_multitokenauth.models import MultiToken, get_key_storage, hash_key, is_token_expired
+
+__all__ = [
+    'find_reusable_token',
+    'introspect_tokens',
+    'issue_login_token',
+    'issue_token',
+    'record_last_login',
+    'revoke_token',
+    'rotate_token',
+    'revoke_tokens',
+]
+
+
+def get_max_tokens_per_user():
+    """ returns the maximum number of tokens per user, configured via AUTH_TOKEN_MAX_PER_USER (0 = unlimited) """
+    return getattr(settings, 'AUTH_TOKEN_MAX_PER_USER', 0)
+
+
+def find_reusable_token(user, name='', user_agent='', using=None):
+    """
+    returns the newest token of the user with the given name and user agent if it has not expired, or None
+
+    Tokens whose key is not stored (AUTH_TOKEN_KEY_STORAGE = 'digest') can't be reused.
+    """
+    tokens = MultiToken.objects.using(using).filter(user=user, name=name).filter_user_agent(user_agent)
+    token = tokens.order_by('-pk').first()
+    if token is not None and token.key and not token.is_expired():
+        return token
+    return None
+
+
+def issue_token(user, reuse=False, **kwargs):
+    """
+    Creates a new token for the user, with the given field values
+
+    With reuse, an existing token of the user with the same name and user agent is returned instead, if there is one
+    which has not expired.
+
+    If AUTH_TOKEN_MAX_PER_USER is set, the least recently used tokens of the user are revoked in the same transaction,
+    so that the user does not exceed this number of tokens. The user row is locked for the duration of the
+    transaction, so that concurrent logins of the same user can't exceed the limit either.
+    """
+    using = router.db_for_write(MultiToken)
+    if reuse:
+        token = find_reusable_token(user, kwargs.get('name', ''), kwargs.get('user_agent', ''), using=using)
+        if token is not None:
+            return token
+
+    max_tokens = get_max_tokens_per_user()
+    if not max_tokens:
+        with get_instrumentation().timer('token_insert'):
+            return MultiToken.objects.using(using).create(user=user, **kwargs)
+
+    with transaction.atomic(using=using, savepoint=False):
+        # serialize concurrent logins of this user
+        list(get_user_model()._default_manager.using(using).select_for_update().filter(pk=user.pk).values_list('pk'))
+
+        evicted = list(
+            MultiToken.objects.using(using).filter(user=user)
+            .order_by(Coalesce('last_used', 'created').desc(), '-pk')
+            .values_list('pk', 'key', 'digest')[max_tokens - 1:]
+        )
+        if evicted:
+            MultiToken.objects.using(using).filter(pk__in=[pk for pk, key, digest in evicted]).delete_without_signals()
+            invalidate_now_and_on_commit(
+                invalidate_revoked_tokens, [key or digest for pk, key, digest in evicted], using=using
+            )
+            forget_rotated_tokens([pk for pk, key, digest in evicted])
+
+        with get_instrumentation().timer('token_insert'):
+            return MultiToken.objects.using(using).create(user=user, **kwargs)
+
+
+def record_last_login(user, using=None):
+    """
+    Sets the last login of the user to now with a single UPDATE query, without saving the user or sending signals
+
+    Disabled with AUTH_UPDATE_LAST_LOGIN = False. If AUTH_LAST_LOGIN_INTERVAL is set, the last login is only updated if
+    it is older than this number of seconds, so concurrent logins of the same user (e.g. shared service accounts) don't
+    write (and lock) the user row every time. Returns whether the last login has been updated.
+    """
+    if not getattr(settings, 'AUTH_UPDATE_LAST_LOGIN', True):
+        return False
+
+    now = timezone.now()
+    queryset = get_user_model()._default_manager.using(using).filter(pk=user.pk)
+
+    interval = getattr(settings, 'AUTH_LAST_LOGIN_INTERVAL', 0)
+    if interval:
+        threshold = now - timedelta(seconds=interval)
+        if user.last_login is not None and user.last_login >= threshold:
+            return False
+        # other logins might have updated it in the meantime
+        queryset = queryset.filter(Q(last_login__isnull=True) | Q(last_login__lt=threshold))
+
+    updated = queryset.update(last_login=now) > 0
+    if updated:
+        user.last_login = now
+    return updated
+
+
+def issue_login_token(user, reuse=False, **kwargs):
+    """
+    Records the login of the user (see record_last_login) and issues a token (see issue_token) in a single transaction
+    """
+    using = router.db_for_write(MultiToken)
+    with transaction.atomic(using=using):
+        record_last_login(user, using=using)
+        return issue_token(user, reuse=reuse, **kwargs)
+
+
+def revoke_token(token, user=None):
+    """
+    Revokes (deletes) a single token with a single DELETE query, and evicts it from the token cache
+
+    If user is given, the token is only revoked if it belongs to this user. Returns whether the token has been revoked.
+    """
+    queryset = MultiToken.objects.filter(pk=token.pk)
+    if user is not None:
+        queryset = queryset.filter(user=user)
+
+    with get_instrumentation().timer('logout_delete'):
+        revoked = queryset.delete_without_signals()
+    invalidate_now_and_on_commit(invalidate_revoked_tokens, [token.key or token.digest], using=queryset.write_db)
+    # rotated keys within their grace period would still be accepted otherwise
+    forget_rotated_tokens([token.pk])
+    return revoked > 0
+
+
+def rotate_token(token):
+    """
+    Replaces the key of a token with a new one with a single UPDATE query, keeping all other fields
+
+    The old key remains valid for AUTH_TOKEN_ROTATION_GRACE_PERIOD seconds, so that in-flight requests don't fail.
+    Returns the new key, or None if the token does not exist (anymore).
+    """
+    using = router.db_for_write(MultiToken)
+    old_key = token.key
+    new_key = MultiToken.generate_key()
+    new_fields = MultiToken.get_key_fields(new_key)
+
+    queryset = MultiToken.objects.using(using).filter(pk=token.pk)
+    if old_key:
+        queryset = queryset.filter_key(old_key)
+    else:
+        # with AUTH_TOKEN_KEY_STORAGE = 'digest', tokens loaded from the database only know their digest
+        queryset = queryset.filter(digest=token.digest)
+    if not queryset.update(**new_fields):
+        return None
+
+    # keys of previous rotations are not valid anymore
+    forget_rotated_tokens([token.pk])
+    if old_key:
+        remember_rotated_token(old_key, token.pk)
+    invalidate_now_and_on_commit(invalidate_tokens, [old_key or token.digest], using=using)
+    token.key = new_key
+    if 'digest' in new_fields:
+        token.digest = new_fields['digest']
+    return new_key
+
+
+def revoke_tokens(user=None, queryset=None, exclude_current=None):
+    """
+    Revokes (deletes) tokens with a single DELETE query, e.g. to log a user out everywhere
+
+    Tokens are selected by user and/or an arbitrary MultiToken queryset; exclude_current is a token which is kept
+    (e.g. the token of the current request). No signals are sent; cached tokens are invalidated per user, so the number
+    of revoked tokens does not matter. Returns the number of revoked tokens.
+    """
+    if user is None and queryset is None:
+        raise ValueError('Either user or queryset is required')
+
+    if queryset is None:
+        queryset = MultiToken.objects.all()
+    if user is not None:
+        queryset = queryset.filter(user=user)
+    if exclude_current is not None:
+        queryset = queryset.exclude(pk=exclude_current.pk)
+    # the user ids are read in the same transaction as the tokens are deleted
+    queryset = queryset.using(queryset.write_db)
+
+    with transaction.atomic(using=queryset.db, savepoint=False):
+        if user is not None:
+            user_ids = [user.pk]
+        else:
+            user_ids = list(queryset.order_by().values_list('user_id', flat=True).distinct())
+
+        revoked = queryset.delete_without_signals()
+        invalidate_now_and_on_commit(invalidate_users, user_ids, using=queryset.db)
+
+    return revoked
+
+
+# the token fields which introspection needs, besides the key
+INTROSPECTION_FIELDS = ('user_id', 'name', 'user__is_active', 'created', 'last_used', 'expires')
+
+
+def get_introspection(user_id, name, is_active, created, last_used, expires, now):
+    """ returns the introspection of a token, given its INTROSPECTION_FIELDS """
+    if is_active and not is_token_expired(created, last_used, expires, now):
+        return {'active': True, 'user_id': user_id, 'name': name}
+    return {'active': False}
+
+
+def introspect_tokens(keys):
+    """
+    Checks the validity of several token keys with a single query, e.g. for API gateways
+
+    Returns a dict with an entry per key, containing whether the token is active (it exists, has not expired and its
+    user is active, as checked by MultiTokenAuthentication) and, for active tokens, the user id and the token name.
+    Rotated keys within their grace period are active as well; they need a second query.
+    """
+    now = timezone.now()
+    keys = set(keys)
+    rows = MultiToken.objects.filter_keys(keys).values_list('key', 'digest', *INTROSPECTION_FIELDS)
+
+    # tokens may have been found by their digest (see AUTH_TOKEN_KEY_STORAGE)
+    keys_by_digest = {hash_key(key): key for key in keys} if get_key_storage() != 'plain' else {}
+
+    result = {key: {'active': False} for key in keys}
+    found = set()
+    for key, digest, *fields in rows:
+        if key not in keys:
+            key = keys_by_digest.get(bytes(digest)) if digest is not None else None
+            if key is None:
+                # e.g. matched by a case insensitive collation
+                continue
+        found.add(key)
+        result[key] = get_introspection(*fields, now)
+
+    rotated = get_rotated_token_ids(keys - found)
+    if rotated:
+        rows = MultiToken.objects.filter(pk__in=rotated.values()).values_list('pk', *INTROSPECTION_FIELDS)
+        fields_by_token_id = {token_id: fields for token_id, *fields in rows}
+        for key, token_id in rotated.items():
+            if token_id in fields_by_token_id:
+                result[key] = get_introspection(*fields_by_token_id[token_id], now)
+    return result
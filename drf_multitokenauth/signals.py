@@ -1,12 +1,205 @@
+"""
+Signals of the login views, which can dispatch their receivers off the request path
+
+With AUTH_SIGNAL_DISPATCH set to 'thread' or 'on_commit', receivers run in a bounded pool of threads of the current
+process (with 'on_commit', once the current transaction has been committed). Receivers connected with blocking=True
+always run synchronously. Pending receivers are drained when the process exits.
+"""
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 import django.dispatch
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+
+from drf_multitokenauth.instrumentation import get_instrumentation
 
 __all__ = [
+    'DispatchingSignal',
+    'SignalDispatcher',
+    'signal_dispatcher',
     'pre_auth',
     'post_auth',
 ]
 
+logger = logging.getLogger(__name__)
+
+SIGNAL_DISPATCH_MODES = ('sync', 'thread', 'on_commit')
+
+
+def get_signal_dispatch_mode():
+    mode = getattr(settings, 'AUTH_SIGNAL_DISPATCH', 'sync')
+    if mode not in SIGNAL_DISPATCH_MODES:
+        raise ImproperlyConfigured('AUTH_SIGNAL_DISPATCH must be one of {}'.format(', '.join(SIGNAL_DISPATCH_MODES)))
+    return mode
+
+
+class SignalDispatcher:
+    """
+    Runs functions in a bounded pool of threads of the current process
+
+    At most AUTH_SIGNAL_DISPATCH_QUEUE_SIZE calls can be pending. When the queue is full, the caller waits up to
+    AUTH_SIGNAL_DISPATCH_BLOCK_TIMEOUT seconds for a free slot, and the call is dropped otherwise.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self.dispatched = 0
+        self.completed = 0
+        self.dropped = 0
+        self.errors = 0
+
+    @property
+    def max_workers(self):
+        return getattr(settings, 'AUTH_SIGNAL_DISPATCH_WORKERS', 4)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, 'AUTH_SIGNAL_DISPATCH_QUEUE_SIZE', 1000)
+
+    @property
+    def block_timeout(self):
+        return getattr(settings, 'AUTH_SIGNAL_DISPATCH_BLOCK_TIMEOUT', 0)
+
+    def submit(self, func, *args, **kwargs):
+        """ runs func in the pool; returns False if it has been dropped because the queue is full """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='drf_multitokenauth_signals')
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+            executor, slots = self._executor, self._slots
+
+        block_timeout = self.block_timeout
+        if not slots.acquire(blocking=block_timeout > 0, timeout=block_timeout if block_timeout > 0 else None):
+            with self._lock:
+                self.dropped += 1
+            get_instrumentation().increment('signals_dropped')
+            logger.warning('Dropped %r, %d calls are pending', func, self.max_pending)
+            return False
+
+        try:
+            executor.submit(self._run, slots, func, args, kwargs)
+        except RuntimeError:
+            # the pool has been shut down (e.g. the interpreter is exiting)
+            slots.release()
+            func(*args, **kwargs)
+            return True
+
+        with self._lock:
+            self.dispatched += 1
+        return True
+
+    def _run(self, slots, func, args, kwargs):
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            logger.exception('Error in %r', func)
+            self.count_errors(1)
+        finally:
+            slots.release()
+            with self._lock:
+                self.completed += 1
+            # receivers may have opened database connections in this thread
+            connections.close_all()
+
+    def count_errors(self, errors):
+        with self._lock:
+            self.errors += errors
+
+    def shutdown(self, wait=True):
+        """ stops the pool, waiting for pending calls by default; a new pool is started by the next call """
+        with self._lock:
+            executor, self._executor, self._slots = self._executor, None, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def stats(self):
+        """ returns the dispatched, completed, dropped and error counters and the number of pending calls """
+        with self._lock:
+            return {
+                'dispatched': self.dispatched,
+                'completed': self.completed,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'pending': self.dispatched - self.completed,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.dispatched = self.completed = self.dropped = self.errors = 0
+
+
+# the signal dispatcher of this process
+signal_dispatcher = SignalDispatcher()
+
+# drain pending receivers on worker shutdown
+atexit.register(signal_dispatcher.shutdown)
+
+
+class DispatchingSignal(django.dispatch.Signal):
+    """
+    Signal which dispatches its receivers according to AUTH_SIGNAL_DISPATCH
+
+    Receivers connected with blocking=True run synchronously (before all other receivers), and only their responses are
+    returned by send() unless the dispatch mode is 'sync'. Errors of dispatched receivers are logged.
+    """
+    def __init__(self, *args, **kwargs):
+        super(DispatchingSignal, self).__init__(*args, **kwargs)
+        self.blocking_signal = django.dispatch.Signal(*args, **kwargs)
+
+    def connect(self, receiver, sender=None, weak=True, dispatch_uid=None, blocking=False):
+        if blocking:
+            self.blocking_signal.connect(receiver, sender=sender, weak=weak, dispatch_uid=dispatch_uid)
+        else:
+            super(DispatchingSignal, self).connect(receiver, sender=sender, weak=weak, dispatch_uid=dispatch_uid)
+
+    def disconnect(self, receiver=None, sender=None, dispatch_uid=None):
+        disconnected = self.blocking_signal.disconnect(receiver, sender=sender, dispatch_uid=dispatch_uid)
+        return super(DispatchingSignal, self).disconnect(receiver, sender=sender, dispatch_uid=dispatch_uid) or \
+            disconnected
+
+    def has_listeners(self, sender=None):
+        return self.blocking_signal.has_listeners(sender) or super(DispatchingSignal, self).has_listeners(sender)
+
+    def send(self, sender, **named):
+        mode = get_signal_dispatch_mode()
+        with get_instrumentation().timer('signal_dispatch', mode=mode):
+            responses = self.blocking_signal.send(sender, **named)
+            return responses + self.dispatch(mode, super(DispatchingSignal, self).send, sender, named)
+
+    def send_robust(self, sender, **named):
+        mode = get_signal_dispatch_mode()
+        with get_instrumentation().timer('signal_dispatch', mode=mode):
+            responses = self.blocking_signal.send_robust(sender, **named)
+            return responses + self.dispatch(mode, super(DispatchingSignal, self).send_robust, sender, named)
+
+    def dispatch(self, mode, send, sender, named):
+        """ sends the signal to the non-blocking receivers, returning their responses if they have run synchronously """
+        if mode == 'sync' or not super(DispatchingSignal, self).has_listeners(sender):
+            return send(sender, **named)
+
+        submit = partial(signal_dispatcher.submit, self.send_deferred, sender, named)
+        if mode == 'on_commit':
+            transaction.on_commit(submit)
+        else:
+            submit()
+        return []
+
+    def send_deferred(self, sender, named):
+        responses = super(DispatchingSignal, self).send_robust(sender, **named)
+        errors = [(receiver, response) for receiver, response in responses if isinstance(response, Exception)]
+        for receiver, error in errors:
+            logger.error('Error in receiver %r', receiver, exc_info=error)
+        signal_dispatcher.count_errors(len(errors))
+
+
 # pre-auth signal
-pre_auth = django.dispatch.Signal()
+pre_auth = DispatchingSignal()
 
 # post-auth signal
-post_auth = django.dispatch.Signal()
+post_auth = DispatchingSignal()
@@ -0,0 +1,96 @@
+"""
+Throttling of login attempts, which protects the password hasher from bursts of (bad) logins
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from ipware import get_client_ip
+from rest_framework.throttling import BaseThrottle
+
+from drf_multitokenauth.cache import get_cache_key_prefix, get_token_cache, increment
+
+__all__ = [
+    'LoginRateThrottle',
+]
+
+
+def parse_rate(rate):
+    """ parses a rate in the format of the REST framework throttles (e.g. '5/min') into (attempts, duration) """
+    num_attempts, period = rate.split('/')
+    return int(num_attempts), {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+
+
+class LoginRateThrottle(BaseThrottle):
+    """
+    Throttles login attempts per username and per client IP, before the password is checked
+
+    Rates are configured via AUTH_LOGIN_THROTTLE_RATES, e.g. {'username': '5/min', 'ip': '100/min'}; scopes without a
+    rate are not throttled. Attempts are counted in the token cache with a sliding window, which is approximated by
+    weighting the counter of the previous window.
+
+    Attempts are counted with atomic increments before they are checked, so concurrent attempts can't exceed the
+    limit. Once a limit has been reached, attempts are rejected after reading the counters of all scopes with a single
+    cache round trip, without counting them.
+    """
+    scopes = ('username', 'ip')
+
+    def __init__(self):
+        self.wait_time = None
+
+    def get_rates(self):
+        """ returns the parsed rates (number of attempts, duration in seconds) by scope """
+        rates = getattr(settings, 'AUTH_LOGIN_THROTTLE_RATES', {})
+        return {scope: parse_rate(rates[scope]) for scope in self.scopes if rates.get(scope)}
+
+    def get_cache_key(self, scope, ident, window):
+        return '{}:throttle:{}:{}:{}'.format(
+            get_cache_key_prefix(), scope, hashlib.sha256(ident.encode()).hexdigest(), window
+        )
+
+    def allow_request(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        return self.allow_attempt(username, get_client_ip(request)[0])
+
+    def allow_attempt(self, username, ip):
+        """ returns whether a login attempt for the given username from the given IP is allowed, and counts it """
+        rates = self.get_rates()
+        idents = {'username': str(username).lower() if username else None, 'ip': ip}
+
+        now = time.time()
+        windows = []
+        for scope, (num_attempts, duration) in rates.items():
+            if not idents[scope]:
+                continue
+            window = int(now // duration)
+            windows.append((
+                self.get_cache_key(scope, idents[scope], window),
+                self.get_cache_key(scope, idents[scope], window - 1),
+                num_attempts, duration, (now % duration) / duration
+            ))
+
+        if not windows:
+            return True
+
+        # fast path: reject without counting if a limit has been reached already
+        counts = get_token_cache().get_many([key for window in windows for key in window[:2]])
+        for current, previous, num_attempts, duration, elapsed in windows:
+            if not self.check(counts.get(previous, 0), counts.get(current, 0), num_attempts, duration, elapsed):
+                return False
+
+        for current, previous, num_attempts, duration, elapsed in windows:
+            # the counter is needed for this and the next window; the attempts before this one are checked
+            attempts = increment(current, 2 * duration) - 1
+            if not self.check(counts.get(previous, 0), attempts, num_attempts, duration, elapsed):
+                return False
+        return True
+
+    def check(self, previous_attempts, attempts, num_attempts, duration, elapsed):
+        """ returns whether another attempt is allowed, given the attempts of the previous and the current window """
+        if previous_attempts * (1 - elapsed) + attempts >= num_attempts:
+            self.wait_time = duration * (1 - elapsed)
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_time
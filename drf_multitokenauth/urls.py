@@ -2,11 +2,18 @@
 """
 from django.urls import re_path
 
-from drf_multitokenauth.views import login_and_obtain_auth_token, logout_and_delete_auth_token
+from drf_multitokenauth.views import (
+    introspect_auth_tokens, login_and_obtain_auth_token, logout_all_and_delete_auth_tokens,
+    logout_and_delete_auth_token, rotate_auth_token
+)
 
 app_name = 'drf_multitokenauth'
 
 urlpatterns = [
     re_path(r'^login', login_and_obtain_auth_token, name="auth-login"),  # normal login with session
+    re_path(r'^rotate', rotate_auth_token, name="auth-rotate"),
+    re_path(r'^introspect', introspect_auth_tokens, name="auth-introspect"),
+    # needs to be listed before logout, which would match as well
+    re_path(r'^logout-all', logout_all_and_delete_auth_tokens, name="auth-logout-all"),
     re_path(r'^logout', logout_and_delete_auth_token, name="auth-logout")
 ]
@@ -0,0 +1,165 @@
+"""
+Write-behind tracking of token usage (last used time, IP address and user agent)
+
+Usage is recorded at most once per token and AUTH_TOKEN_USAGE_INTERVAL, buffered in memory and written to the database
+with batched bulk updates in a background thread, off the request path. Pending updates are flushed when the process
+exits.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connections, router, transaction
+from django.utils import timezone
+from ipware import get_client_ip
+
+from drf_multitokenauth.cache import get_cache_key_prefix, get_token_cache
+from drf_multitokenauth.models import LazyMultiToken, MultiToken, truncate_user_agent
+
+__all__ = [
+    'UsageTracker',
+    'usage_tracker',
+]
+
+logger = logging.getLogger(__name__)
+
+# the fields which store the user agent (see MultiToken.get_user_agent)
+USER_AGENT_FIELDS = ['user_agent', 'user_agent_ref']
+
+
+def is_usage_tracking_enabled():
+    return getattr(settings, 'AUTH_TOKEN_TRACK_USAGE', False)
+
+
+class UsageTracker:
+    """
+    Buffers token usage in the memory of the current process
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._recorded = {}
+        self._flushed_at = timezone.now()
+        self._flush_thread = None
+
+    @property
+    def interval(self):
+        return getattr(settings, 'AUTH_TOKEN_USAGE_INTERVAL', 60)
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'AUTH_TOKEN_USAGE_BATCH_SIZE', 500)
+
+    def record(self, token, request):
+        """ records that the token has been used by the given request """
+        now = timezone.now()
+        if self.debounce(token, now) and get_token_cache().add(self.get_cache_key(token), 1, self.interval):
+            self.add_pending(token, request, now)
+
+    async def arecord(self, token, request):
+        now = timezone.now()
+        if self.debounce(token, now) and await get_token_cache().aadd(self.get_cache_key(token), 1, self.interval):
+            self.add_pending(token, request, now)
+
+    def get_cache_key(self, token):
+        return '{}:used:{}'.format(get_cache_key_prefix(), token.pk)
+
+    def debounce(self, token, now):
+        """ returns whether the usage of the token should be recorded, i.e. this process has not within the interval """
+        if not isinstance(token, (MultiToken, LazyMultiToken)):
+            # e.g. legacy tokens of DualReadMultiTokenAuthentication
+            return False
+
+        # debounce within this process first, then across processes (see get_cache_key)
+        with self._lock:
+            recorded_at = self._recorded.get(token.pk)
+            if recorded_at is not None and (now - recorded_at).total_seconds() < self.interval:
+                return False
+            self._recorded[token.pk] = now
+
+        # keep (locally) cached tokens up to date for the sliding expiry
+        token.last_used = now
+        return True
+
+    def add_pending(self, token, request, now):
+        with self._lock:
+            self._pending[token.pk] = (
+                now,
+                get_client_ip(request)[0],
+                truncate_user_agent(request.META.get('HTTP_USER_AGENT')),
+            )
+            flush = len(self._pending) >= self.batch_size or (now - self._flushed_at).total_seconds() >= self.interval
+
+        if flush:
+            self.flush_in_background()
+
+    def flush_in_background(self):
+        """ flushes the pending updates in a background thread, unless such a flush is still running """
+        with self._lock:
+            if self._flush_thread is not None and self._flush_thread.is_alive():
+                return
+            self._flush_thread = threading.Thread(
+                target=self._flush_in_thread, name='drf_multitokenauth_usage', daemon=True
+            )
+            self._flush_thread.start()
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        finally:
+            # the database connections of this thread
+            connections.close_all()
+
+    def join(self, timeout=None):
+        """ waits for a background flush to finish """
+        thread = self._flush_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def flush(self):
+        """ writes all pending updates to the database """
+        now = timezone.now()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = now
+            # forget debounce timestamps which have expired anyway
+            interval = self.interval
+            self._recorded = {
+                pk: recorded_at for pk, recorded_at in self._recorded.items()
+                if (now - recorded_at).total_seconds() < interval
+            }
+
+        if not pending:
+            return
+
+        using = router.db_for_write(MultiToken)
+        try:
+            # a savepoint within transactions of the caller (e.g. flush() in tests), which must not break on errors
+            with transaction.atomic(using=using):
+                with_ip, without_ip = [], []
+                for pk, (last_used, last_known_ip, user_agent) in pending.items():
+                    token = MultiToken(pk=pk, last_used=last_used, user_agent=user_agent)
+                    # bulk_update does not call save()
+                    token.normalize_user_agent(using=using)
+                    if last_known_ip:
+                        token.last_known_ip = last_known_ip
+                        with_ip.append(token)
+                    else:
+                        without_ip.append(token)
+
+                MultiToken.objects.using(using).bulk_update(
+                    with_ip, ['last_used', 'last_known_ip'] + USER_AGENT_FIELDS, batch_size=self.batch_size
+                )
+                MultiToken.objects.using(using).bulk_update(
+                    without_ip, ['last_used'] + USER_AGENT_FIELDS, batch_size=self.batch_size
+                )
+        except DatabaseError:
+            logger.exception('Failed to write the usage of %d tokens', len(pending))
+
+
+# the usage tracker of this process
+usage_tracker = UsageTracker()
+
+# drain the buffer on worker shutdown
+atexit.register(usage_tracker.flush)
@@ -1,87 +1,335 @@
+import json
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.contrib.auth.models import update_last_login
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from ipware import get_client_ip
-from rest_framework import parsers, renderers, status
-from rest_framework.authentication import get_authorization_header
+from rest_framework import exceptions, parsers, permissions, renderers, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from drf_multitokenauth.models import MultiToken
-from drf_multitokenauth.serializers import MultiAuthTokenSerializer
+from drf_multitokenauth.coreauthentication import MultiTokenAuthentication
+from drf_multitokenauth.export import (
+    EXPORT_FORMATS, get_export_queryset, iter_export, iter_export_rows, parse_date_filter
+)
+from drf_multitokenauth.instrumentation import get_instrumentation
+from drf_multitokenauth.models import LazyMultiToken, MultiToken
+from drf_multitokenauth.serializers import (
+    IntrospectionSerializer, LogoutAllSerializer, LogoutSerializer, MultiAuthTokenSerializer
+)
+from drf_multitokenauth.services import (
+    introspect_tokens, issue_login_token, revoke_token, revoke_tokens, rotate_token
+)
 from drf_multitokenauth.signals import pre_auth, post_auth
+from drf_multitokenauth.throttling import LoginRateThrottle
 
 __all__ = [
     'LogoutAndDeleteAuthToken',
+    'LogoutAllAndDeleteAuthTokens',
     'LoginAndObtainAuthToken',
+    'RotateAuthToken',
+    'IntrospectAuthTokens',
+    'ExportAuthTokens',
+    'AsyncLogoutAndDeleteAuthToken',
+    'AsyncLoginAndObtainAuthToken',
     'login_and_obtain_auth_token',
     'logout_and_delete_auth_token',
+    'logout_all_and_delete_auth_tokens',
+    'rotate_auth_token',
+    'introspect_auth_tokens',
+    'export_auth_tokens',
+    'async_login_and_obtain_auth_token',
+    'async_logout_and_delete_auth_token',
 ]
 
 
+def logout_user(serializer, user, token):
+    """
+    deletes the given token of the user or, if the serializer has a list of token names, all tokens of the user with
+    these names
+
+    Returns the response data and status.
+    """
+    if not serializer.is_valid():
+        return serializer.errors, status.HTTP_400_BAD_REQUEST
+
+    names = serializer.validated_data.get('names')
+    if names:
+        revoked = revoke_tokens(user=user, queryset=MultiToken.objects.filter(name__in=names))
+        return {'status': 'logged out', 'revoked': revoked}, status.HTTP_200_OK
+
+    # delete the token this request has been authenticated with
+    if isinstance(token, (MultiToken, LazyMultiToken)) and revoke_token(token, user):
+        return {'status': 'logged out'}, status.HTTP_200_OK
+    return {'error': 'invalid token'}, status.HTTP_400_BAD_REQUEST
+
+
+def check_login_credentials(serializer):
+    """ validates the login credentials of the serializer, which hashes the password; returns whether they are valid """
+    instrumentation = get_instrumentation()
+    with instrumentation.timer('login_password_check'):
+        valid = serializer.is_valid()
+    if not valid:
+        instrumentation.increment('logins', result='invalid')
+    return valid
+
+
+def login_user(sender, request, data, validated_data):
+    """
+    logs in the user of validated login credentials and issues a token, firing the pre_auth and post_auth signals
+
+    Returns the response data and status.
+    """
+    instrumentation = get_instrumentation()
+    user = validated_data['user']
+    token_name = validated_data['token_name']
+    reuse_token = validated_data['reuse_token'] or getattr(settings, 'AUTH_TOKEN_REUSE', False)
+
+    # fire pre_auth signal
+    pre_auth.send(
+        sender=sender,
+        username=data['username'],
+        password=data['password'],
+        token_name=token_name
+    )
+
+    superuser_login_enabled = getattr(settings, 'AUTH_ENABLE_SUPERUSER_LOGIN', True)
+    if not superuser_login_enabled and user.is_superuser:
+        instrumentation.increment('logins', result='forbidden')
+        return {'error': 'superusers can\'t log in'}, status.HTTP_403_FORBIDDEN
+
+    # check that user is authenticated
+    if user.is_authenticated:
+        token = issue_login_token(
+            user,
+            user_agent=request.META.get('HTTP_USER_AGENT', ''),
+            last_known_ip=get_client_ip(request)[0],
+            name=token_name,
+            reuse=reuse_token,
+        )
+
+        # fire post_auth signal
+        post_auth.send(sender=sender, user=user)
+        instrumentation.increment('logins', result='success')
+
+        return {'token': token.key}, status.HTTP_200_OK
+    # else:
+    return {'error': 'not logged in'}, status.HTTP_401_UNAUTHORIZED
+
+
 class LogoutAndDeleteAuthToken(APIView):
-    """ Custom API View for logging out"""
+    """
+    Custom API View for logging out
+
+    Deletes the token of the request, or (if a list of token names is given) all tokens of the user with these names.
+    """
+    serializer_class = LogoutSerializer
+
+    def post(self, request, *args, **kwargs):
+        # only allow authenticated users to logout
+        if request.user.is_authenticated:
+            data, response_status = logout_user(
+                self.serializer_class(data=request.data), request.user, request.auth
+            )
+            return Response(data, status=response_status)
+
+        return Response({'error': 'not logged in'}, status=status.HTTP_401_UNAUTHORIZED)
+
+
+class LogoutAllAndDeleteAuthTokens(APIView):
+    """ Custom API View for logging out everywhere, i.e. deleting all tokens of the user """
+    serializer_class = LogoutAllSerializer
 
     def post(self, request, *args, **kwargs):
         # only allow authenticated users to logout
         if request.user.is_authenticated:
-            # delete this users auth token
-            auth_header = get_authorization_header(request)
+            serializer = self.serializer_class(data=request.data)
+            serializer.is_valid(raise_exception=True)
 
-            token = auth_header.split()[1].decode()
-            tokens = MultiToken.objects.filter(key=token, user=request.user)
-            if len(tokens) == 1:
-                tokens.delete()
-                return Response({'status': 'logged out'})
-            else:
-                return Response({'error': 'invalid token'}, status=status.HTTP_400_BAD_REQUEST)
+            keep_current = serializer.validated_data['keep_current'] and isinstance(
+                request.auth, (MultiToken, LazyMultiToken)
+            )
+            revoked = revoke_tokens(user=request.user, exclude_current=request.auth if keep_current else None)
+            return Response({'status': 'logged out', 'revoked': revoked})
 
         return Response({'error': 'not logged in'}, status=status.HTTP_401_UNAUTHORIZED)
 
 
 class LoginAndObtainAuthToken(APIView):
     """ Custom View for logging in and getting the auth token """
-    throttle_classes = ()
+    throttle_classes = (LoginRateThrottle,)
     permission_classes = ()
     parser_classes = (parsers.FormParser, parsers.MultiPartParser, parsers.JSONParser,)
     renderer_classes = (renderers.JSONRenderer,)
     serializer_class = MultiAuthTokenSerializer
 
+    def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data)
+        if not check_login_credentials(serializer):
+            raise exceptions.ValidationError(serializer.errors)
+
+        data, response_status = login_user(self.__class__, request, request.data, serializer.validated_data)
+        return Response(data, status=response_status)
+
+
+class RotateAuthToken(APIView):
+    """
+    Custom API View for rotating the token of the request
+
+    Returns the new key; the old key remains valid for AUTH_TOKEN_ROTATION_GRACE_PERIOD seconds.
+    """
+
+    def post(self, request, *args, **kwargs):
+        # only allow authenticated users to rotate their token
+        if request.user.is_authenticated:
+            if isinstance(request.auth, (MultiToken, LazyMultiToken)):
+                key = rotate_token(request.auth)
+                if key is not None:
+                    return Response({'token': key})
+            return Response({'error': 'invalid token'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'error': 'not logged in'}, status=status.HTTP_401_UNAUTHORIZED)
+
+
+class IntrospectAuthTokens(APIView):
+    """
+    Custom API View for checking several token keys at once, e.g. by API gateways
+
+    Returns whether each key belongs to an active token and, if so, its user id and token name.
+    """
+    permission_classes = (permissions.IsAdminUser,)
+    serializer_class = IntrospectionSerializer
+
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        user = serializer.validated_data['user']
-        token_name = serializer.validated_data['token_name']
+        keys = serializer.validated_data['keys']
+        tokens = introspect_tokens(keys)
+        return Response({'tokens': [dict(tokens[key], key=key) for key in keys]})
+
+
+class ExportAuthTokens(APIView):
+    """
+    Custom API View for exporting tokens (without their keys) as CSV or JSON lines, for staff users
+
+    The export is streamed, so it can be used for tables of any size. Supports the query parameters export_format (csv
+    or jsonl; format is used for content negotiation by the REST framework), user_id, name, created_after and
+    created_before.
+    """
+    permission_classes = (permissions.IsAdminUser,)
+    chunk_size = 2000
+    content_types = {
+        'csv': 'text/csv',
+        'jsonl': 'application/x-ndjson',
+    }
 
-        # fire pre_auth signal
-        pre_auth.send(
-            sender=self.__class__,
-            username=request.data['username'],
-            password=request.data['password'],
-            token_name=token_name
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        export_format = params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({'error': 'invalid format'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user_id = int(params['user_id']) if params.get('user_id') else None
+            created_after, created_before = [
+                parse_date_filter(params[param]) if params.get(param) else None
+                for param in ('created_after', 'created_before')
+            ]
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = get_export_queryset(user_id, params.get('name'), created_after, created_before)
+        response = StreamingHttpResponse(
+            iter_export(iter_export_rows(queryset, self.chunk_size), export_format),
+            content_type=self.content_types[export_format]
         )
+        response['Content-Disposition'] = 'attachment; filename="tokens.{}"'.format(export_format)
+        return response
 
-        superuser_login_enabled = getattr(settings, 'AUTH_ENABLE_SUPERUSER_LOGIN', True)
-        if not superuser_login_enabled and user.is_superuser:
-            return Response({'error': 'superusers can\'t log in'}, status=status.HTTP_403_FORBIDDEN)
-
-        # check that user is authenticated
-        if user.is_authenticated:
-            update_last_login(None, user)
-            token = MultiToken.objects.create(
-                user=user,
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                last_known_ip=get_client_ip(request)[0],
-                name=token_name,
-            )
 
-            # fire post_auth signal
-            post_auth.send(sender=self.__class__, user=user)
+def json_response(data, status=status.HTTP_200_OK):
+    """ returns a JSON response, rendered like the JSONRenderer of the REST views """
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
 
-            return Response({'token': token.key})
-        # else:
-        return Response({'error': 'not logged in'}, status=status.HTTP_401_UNAUTHORIZED)
+
+def get_request_data(request):
+    """
+    returns the JSON or form encoded body of a (non REST framework) request, or None if it can't be parsed or is not
+    an object
+    """
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncLogoutAndDeleteAuthToken(View):
+    """ Async counterpart of LogoutAndDeleteAuthToken, for ASGI deployments """
+    authentication_class = MultiTokenAuthentication
+    serializer_class = LogoutSerializer
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            credentials = await self.authentication_class().aauthenticate(request)
+        except exceptions.AuthenticationFailed as e:
+            return json_response({'detail': e.detail}, status=status.HTTP_401_UNAUTHORIZED)
+
+        # only allow authenticated users to logout
+        if credentials is None:
+            return json_response({'error': 'not logged in'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        data = get_request_data(request)
+        if data is None:
+            return json_response({'detail': 'JSON parse error'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user, token = credentials
+        data, response_status = await sync_to_async(logout_user)(self.serializer_class(data=data), user, token)
+        return json_response(data, status=response_status)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncLoginAndObtainAuthToken(View):
+    """ Async counterpart of LoginAndObtainAuthToken, for ASGI deployments """
+    serializer_class = MultiAuthTokenSerializer
+    throttle_class = LoginRateThrottle
+
+    async def post(self, request, *args, **kwargs):
+        data = get_request_data(request)
+        if data is None:
+            return json_response({'detail': 'JSON parse error'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # throttled before the password is hashed
+        throttle = self.throttle_class()
+        if not await sync_to_async(throttle.allow_attempt)(data.get('username'), get_client_ip(request)[0]):
+            throttled = exceptions.Throttled(throttle.wait())
+            response = json_response({'detail': throttled.detail}, status=throttled.status_code)
+            response['Retry-After'] = '%d' % throttle.wait()
+            return response
+
+        serializer = self.serializer_class(data=data)
+        # validating the credentials hashes the password, so it runs in a thread
+        if not await sync_to_async(check_login_credentials)(serializer):
+            return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data, response_status = await sync_to_async(login_user)(
+            self.__class__, request, data, serializer.validated_data
+        )
+        return json_response(data, status=response_status)
 
 
 login_and_obtain_auth_token = LoginAndObtainAuthToken.as_view()
 logout_and_delete_auth_token = LogoutAndDeleteAuthToken.as_view()
+logout_all_and_delete_auth_tokens = LogoutAllAndDeleteAuthTokens.as_view()
+rotate_auth_token = RotateAuthToken.as_view()
+introspect_auth_tokens = IntrospectAuthTokens.as_view()
+export_auth_tokens = ExportAuthTokens.as_view()
+async_login_and_obtain_auth_token = AsyncLoginAndObtainAuthToken.as_view()
+async_logout_and_delete_auth_token = AsyncLogoutAndDeleteAuthToken.as_view()
@@ -14,6 +14,9 @@ setup(
     install_requires=[
         'django-ipware==3.0.*',
     ],
+    extras_require={
+        'prometheus': ['prometheus-client'],
+    },
     include_package_data=True,
     license='BSD License',
     description='An extension of django rest frameworks token auth, providing multiple authentication tokens per user',
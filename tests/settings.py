@@ -40,6 +40,8 @@ INSTALLED_APPS = [
 
     # include django rest framework
     'rest_framework',
+    # only used by the tests of migrate_authtoken
+    'rest_framework.authtoken',
 
     # include multi token auth
     'drf_multitokenauth'
@@ -81,7 +83,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # only used by tests which route token lookups to a (simulated) replica
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+    },
 }
 
 
@@ -5,6 +5,7 @@ from django.contrib.auth.models import User
 from django.db.models import Q
 from django.test import override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 
@@ -19,6 +20,7 @@ class HelperMixin:
         """ set up urls by using djangos reverse function """
         self.login_url = reverse('multi_token_auth:auth-login')
         self.logout_url = reverse('multi_token_auth:auth-logout')
+        self.logout_all_url = reverse('multi_token_auth:auth-logout-all')
 
     def set_client_credentials(self, token):
         """ set client credentials, namely the auth token """
@@ -331,6 +333,163 @@ class AuthTestCase(APITestCase, HelperMixin):
         response = self.rest_do_logout(None)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_login_reuse_token(self):
+        """ with reuse_token, a login with the same token name and user agent returns the existing token """
+        token1 = self.login_and_obtain_token('user1', 'secret1', token_name='ci', HTTP_USER_AGENT='batch')
+
+        response = self.client.post(
+            self.login_url,
+            {'username': 'user1', 'password': 'secret1', 'token_name': 'ci', 'reuse_token': True},
+            format='json',
+            HTTP_USER_AGENT='batch'
+        )
+        self.assertEqual(response.data, {'token': token1})
+
+        # another user agent gets a new token
+        response = self.client.post(
+            self.login_url,
+            {'username': 'user1', 'password': 'secret1', 'token_name': 'ci', 'reuse_token': True},
+            format='json',
+            HTTP_USER_AGENT='other'
+        )
+        self.assertNotEqual(response.data['token'], token1)
+        self.assertEqual(MultiToken.objects.filter(user=self.user1).count(), 2)
+
+    @override_settings(AUTH_TOKEN_REUSE=True)
+    def test_login_reuse_token_setting(self):
+        """ AUTH_TOKEN_REUSE enables reusing tokens for all logins """
+        token1 = self.login_and_obtain_token('user1', 'secret1', token_name='ci')
+        token2 = self.login_and_obtain_token('user1', 'secret1', token_name='ci')
+
+        self.assertEqual(token1, token2)
+        self.assertEqual(MultiToken.objects.count(), 1)
+
+    def test_logout_queries(self):
+        """ logout authenticates with a single query, and deletes the token with a single DELETE """
+        token = self.login_and_obtain_token('user1', 'secret1')
+
+        with self.assertNumQueries(2):
+            response = self.rest_do_logout(token)
+        self.assertEqual(response.data, {'status': 'logged out'})
+        self.assertEqual(MultiToken.objects.count(), 0)
+
+    def test_logout_named_tokens(self):
+        """ logs out several named tokens of the user at once """
+        token1 = self.login_and_obtain_token('user1', 'secret1', token_name='phone')
+        self.login_and_obtain_token('user1', 'secret1', token_name='laptop')
+        token3 = self.login_and_obtain_token('user1', 'secret1', token_name='tablet')
+        token4 = self.login_and_obtain_token('user2', 'secret2', token_name='phone')
+
+        self.set_client_credentials(token3)
+        response = self.client.post(self.logout_url, {'names': ['phone', 'laptop']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'status': 'logged out', 'revoked': 2})
+
+        # tokens of other users are not affected
+        self.assertEqual(sorted(MultiToken.objects.values_list('key', flat=True)), sorted([token3, token4]))
+
+        # the revoked tokens can't be used anymore
+        response = self.rest_do_logout(token1)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_rotate(self):
+        """ rotating a token replaces its key, and keeps the old key valid for the grace period """
+        token = self.login_and_obtain_token('user1', 'secret1', token_name='ci', HTTP_USER_AGENT='batch')
+        created = MultiToken.objects.get(key=token).created
+
+        self.set_client_credentials(token)
+        response = self.client.post(reverse('multi_token_auth:auth-rotate'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        new_token = response.data['token']
+        self.assertNotEqual(new_token, token)
+
+        # metadata is kept
+        rotated = MultiToken.objects.get()
+        self.assertEqual(rotated.key, new_token)
+        self.assertEqual((rotated.name, rotated.user_agent, rotated.created), ('ci', 'batch', created))
+
+        # both keys can be used during the grace period
+        self.assertEqual(self.rest_do_logout(token).status_code, status.HTTP_200_OK)
+        self.assertFalse(MultiToken.objects.exists())
+
+    def test_rotate_without_token(self):
+        """ Try to rotate without a token """
+        self.reset_client_credentials()
+        response = self.client.post(reverse('multi_token_auth:auth-rotate'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_introspect(self):
+        """ checks several token keys at once """
+        token1 = self.login_and_obtain_token('user1', 'secret1', token_name='phone')
+        token2 = self.login_and_obtain_token('user2', 'secret2')
+        token3 = self.login_and_obtain_token('user2', 'secret2')
+        admin_token = self.login_and_obtain_token('superuser', 'secret3')
+        MultiToken.objects.filter(key=token3).update(expires=timezone.now())
+        User.objects.filter(pk=self.user2.pk).update(is_active=False)
+
+        self.set_client_credentials(admin_token)
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                reverse('multi_token_auth:auth-introspect'), {'keys': [token1, token2, token3, 'a']}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'tokens': [
+            {'key': token1, 'active': True, 'user_id': self.user1.pk, 'name': 'phone'},
+            {'key': token2, 'active': False},
+            {'key': token3, 'active': False},
+            {'key': 'a', 'active': False},
+        ]})
+
+    @override_settings(AUTH_TOKEN_INTROSPECTION_MAX_BATCH=2)
+    def test_introspect_max_batch(self):
+        """ the number of keys per request is limited """
+        self.set_client_credentials(self.login_and_obtain_token('superuser', 'secret3'))
+        response = self.client.post(
+            reverse('multi_token_auth:auth-introspect'), {'keys': ['a', 'b', 'c']}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_introspect_requires_admin(self):
+        """ only admin users can introspect tokens """
+        token = self.login_and_obtain_token('user1', 'secret1')
+        self.set_client_credentials(token)
+        response = self.client.post(reverse('multi_token_auth:auth-introspect'), {'keys': [token]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_logout_all(self):
+        """ logs out everywhere, i.e. deletes all tokens of the user """
+        token1 = self.login_and_obtain_token('user1', 'secret1')
+        self.login_and_obtain_token('user1', 'secret1')
+        token3 = self.login_and_obtain_token('user2', 'secret2')
+
+        self.set_client_credentials(token1)
+        response = self.client.post(self.logout_all_url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'status': 'logged out', 'revoked': 2})
+
+        # only the token of user2 is left
+        self.assertEqual(list(MultiToken.objects.values_list('key', flat=True)), [token3])
+
+        # token1 can't be used anymore
+        response = self.client.post(self.logout_all_url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_all_keep_current(self):
+        """ logs out everywhere else, keeping the current token """
+        token1 = self.login_and_obtain_token('user1', 'secret1')
+        self.login_and_obtain_token('user1', 'secret1')
+
+        self.set_client_credentials(token1)
+        response = self.client.post(self.logout_all_url, {'keep_current': True}, format='json')
+        self.assertEqual(response.data, {'status': 'logged out', 'revoked': 1})
+        self.assertEqual(list(MultiToken.objects.values_list('key', flat=True)), [token1])
+
+    def test_logout_all_without_token(self):
+        """ Try to logout everywhere without a token """
+        self.reset_client_credentials()
+        response = self.client.post(self.logout_all_url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
     @patch('drf_multitokenauth.signals.pre_auth.send')
     @patch('drf_multitokenauth.signals.post_auth.send')
     def test_signals(self, mock_pre_auth, mock_post_auth):
@@ -0,0 +1,64 @@
+from django.contrib.admin import helpers
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from drf_multitokenauth.models import MultiToken
+
+
+class MultiTokenAdminTestCase(TestCase):
+    """
+    Test Cases for the MultiToken admin
+    """
+    def setUp(self):
+        self.superuser = User.objects.create_superuser("admin", "admin@mail.com", "secret")
+        self.users = [User.objects.create_user("user{}".format(i), password="secret") for i in range(3)]
+        self.tokens = [MultiToken.objects.create(user=user, user_agent='agent') for user in self.users]
+        self.client.force_login(self.superuser)
+        self.changelist_url = reverse('admin:drf_multitokenauth_multitoken_changelist')
+
+    def test_changelist_queries(self):
+        """ the number of queries does not depend on the number of tokens """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.changelist_url)
+        self.assertEqual(response.status_code, 200)
+
+        for user in self.users:
+            MultiToken.objects.create(user=user, user_agent='agent')
+        with self.assertNumQueries(len(queries)):
+            self.client.get(self.changelist_url)
+
+    def test_search(self):
+        """ tokens can be found by their exact key or by user id """
+        response = self.client.get(self.changelist_url, {'q': self.tokens[0].key})
+        self.assertEqual(list(response.context['cl'].result_list), [self.tokens[0]])
+
+        response = self.client.get(self.changelist_url, {'q': str(self.users[1].pk)})
+        self.assertEqual(list(response.context['cl'].result_list), [self.tokens[1]])
+
+        response = self.client.get(self.changelist_url, {'q': self.tokens[0].key[:10]})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+    def test_revoke_selected(self):
+        MultiToken.objects.create(user=self.users[0])
+
+        response = self.client.post(self.changelist_url, {
+            'action': 'revoke_selected',
+            helpers.ACTION_CHECKBOX_NAME: [self.tokens[0].pk, self.tokens[1].pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(MultiToken.objects.count(), 2)
+        self.assertFalse(MultiToken.objects.filter(pk__in=[self.tokens[0].pk, self.tokens[1].pk]).exists())
+
+    def test_revoke_all_for_users(self):
+        MultiToken.objects.create(user=self.users[0])
+
+        self.client.post(self.changelist_url, {
+            'action': 'revoke_all_for_users',
+            helpers.ACTION_CHECKBOX_NAME: [self.tokens[0].pk],
+        })
+        self.assertEqual(list(MultiToken.objects.values_list('user', flat=True).order_by('user')), [
+            self.users[1].pk, self.users[2].pk
+        ])
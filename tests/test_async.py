@@ -0,0 +1,141 @@
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+
+from drf_multitokenauth.cache import aget_or_load_credentials, aget_user_generation, get_cache_key, invalidate_users
+from drf_multitokenauth.coreauthentication import CachedMultiTokenAuthentication, MultiTokenAuthentication
+from drf_multitokenauth.models import LazyMultiToken, MultiToken
+from drf_multitokenauth.services import revoke_tokens
+
+
+class AsyncAuthenticationTestCase(TestCase):
+    """
+    Test Cases for the async authentication and the async login and logout views
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.token = MultiToken.objects.create(user=self.user)
+
+    async def test_aauthenticate_credentials(self):
+        """ tokens can be authenticated with the async ORM """
+        user, token = await MultiTokenAuthentication().aauthenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+        self.assertEqual(token, self.token)
+
+        with self.assertRaises(AuthenticationFailed):
+            await MultiTokenAuthentication().aauthenticate_credentials(self.token.key + "a")
+
+    @override_settings(AUTH_TOKEN_LEAN_LOOKUP=True)
+    async def test_aauthenticate_credentials_lean(self):
+        """ the lean lookup is available for the async ORM """
+        user, token = await MultiTokenAuthentication().aauthenticate_credentials(self.token.key)
+        self.assertIsInstance(token, LazyMultiToken)
+        self.assertEqual(token.pk, self.token.pk)
+
+    async def test_cached_aauthenticate_credentials(self):
+        """ the cached authentication uses the async cache API """
+        authentication = CachedMultiTokenAuthentication()
+        await authentication.aauthenticate_credentials(self.token.key)
+        await sync_to_async(MultiToken.objects.filter(pk=self.token.pk).update)(name="changed")
+
+        user, token = await authentication.aauthenticate_credentials(self.token.key)
+        self.assertEqual(token.name, "")
+
+    async def test_revocation_during_async_load(self):
+        """ credentials which have been loaded before a concurrent revocation are not cached """
+        await aget_user_generation(self.user.pk)
+
+        async def loader():
+            credentials = await MultiTokenAuthentication().aauthenticate_credentials(self.token.key)
+            await sync_to_async(MultiToken.objects.filter(pk=self.token.pk).delete_without_signals)()
+            await sync_to_async(invalidate_users)([self.user.pk])
+            return credentials
+
+        await aget_or_load_credentials(self.token.key, loader)
+
+        with self.assertRaises(AuthenticationFailed):
+            await CachedMultiTokenAuthentication().aauthenticate_credentials(self.token.key)
+
+    @override_settings(AUTH_TOKEN_CACHE_LOCK_TIMEOUT=5)
+    async def test_async_waiting_ignores_revoked_entry(self):
+        """ a waiting coroutine does not return the entry of a token which has been revoked in the meantime """
+        authentication = CachedMultiTokenAuthentication()
+        await authentication.aauthenticate_credentials(self.token.key)
+        cache_key = get_cache_key(self.token.key)
+        await cache.aadd(cache_key + ':lock', 1, 5)
+        await sync_to_async(revoke_tokens)(user=self.user)
+        threading.Timer(0.1, cache.delete, [cache_key + ':lock']).start()
+
+        with self.assertRaises(AuthenticationFailed):
+            await authentication.aauthenticate_credentials(self.token.key)
+
+    async def test_async_login_and_logout(self):
+        """ tokens can be obtained and deleted with the async views """
+        response = await self.async_client.post(
+            reverse('async-auth-login'),
+            {'username': 'user1', 'password': 'secret1', 'token_name': 'async'},
+            content_type='application/json',
+            headers={'user-agent': 'agent'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        key = json.loads(response.content)['token']
+
+        token = await MultiToken.objects.aget(key=key)
+        self.assertEqual(token.name, 'async')
+        self.assertEqual(token.user_agent, 'agent')
+
+        response = await self.async_client.post(
+            reverse('async-auth-logout'), headers={'authorization': 'Token ' + key}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b'{"status":"logged out"}')
+        self.assertFalse(await MultiToken.objects.filter(key=key).aexists())
+
+    async def test_async_logout_with_names(self):
+        """ the async logout view deletes the tokens with the given names """
+        await MultiToken.objects.acreate(user=self.user, name='phone')
+        await MultiToken.objects.acreate(user=self.user, name='laptop')
+
+        response = await self.async_client.post(
+            reverse('async-auth-logout'),
+            {'names': ['phone', 'laptop']},
+            content_type='application/json',
+            headers={'authorization': 'Token ' + self.token.key},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), {'status': 'logged out', 'revoked': 2})
+        self.assertEqual(await MultiToken.objects.filter(user=self.user).acount(), 1)
+
+    async def test_async_login_with_invalid_credentials(self):
+        """ invalid credentials are rejected by the async login view """
+        response = await self.async_client.post(
+            reverse('async-auth-login'),
+            {'username': 'user1', 'password': 'wrong'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('non_field_errors', json.loads(response.content))
+
+    async def test_async_login_with_invalid_body(self):
+        """ bodies which are not a JSON object are rejected by the async login view """
+        for body in ('[1]', '"user1"', '{'):
+            response = await self.async_client.post(
+                reverse('async-auth-login'), body, content_type='application/json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_async_logout_with_invalid_token(self):
+        """ the async logout view rejects invalid tokens """
+        response = await self.async_client.post(
+            reverse('async-auth-logout'), headers={'authorization': 'Token ' + self.token.key + 'a'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertTrue(await MultiToken.objects.filter(pk=self.token.pk).aexists())
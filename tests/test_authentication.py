@@ -0,0 +1,67 @@
+import pickle
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from drf_multitokenauth.coreauthentication import CachedMultiTokenAuthentication, MultiTokenAuthentication
+from drf_multitokenauth.models import LazyMultiToken, MultiToken
+
+
+@override_settings(AUTH_TOKEN_LEAN_LOOKUP=True)
+class LeanLookupTestCase(TestCase):
+    """
+    Test Cases for the lean token lookup
+    """
+    def setUp(self):
+        cache.clear()
+        self.authentication = MultiTokenAuthentication()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.token = MultiToken.objects.create(user=self.user, name="token name", user_agent="agent")
+
+    def test_lean_lookup_returns_lazy_token(self):
+        """ the lean lookup needs a single query and returns a LazyMultiToken """
+        with self.assertNumQueries(1):
+            user, token = self.authentication.authenticate_credentials(self.token.key)
+            self.assertEqual(user.pk, self.user.pk)
+            self.assertEqual(user.username, 'user1')
+            self.assertTrue(user.is_active)
+            self.assertEqual(token.pk, self.token.pk)
+            self.assertEqual(token.key, self.token.key)
+
+        self.assertIsInstance(token, LazyMultiToken)
+        self.assertEqual(token, self.token)
+
+    def test_lazy_fields_are_loaded_on_access(self):
+        """ fields which are not needed for authentication are loaded on first access """
+        user, token = self.authentication.authenticate_credentials(self.token.key)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(token.name, "token name")
+            self.assertEqual(token.user_agent, "agent")
+
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "user1@mail.com")
+
+    @override_settings(AUTH_TOKEN_LEAN_LOOKUP_MODEL=True)
+    def test_lean_lookup_returns_model(self):
+        """ with AUTH_TOKEN_LEAN_LOOKUP_MODEL a MultiToken with deferred fields is returned """
+        with self.assertNumQueries(1):
+            user, token = self.authentication.authenticate_credentials(self.token.key)
+
+        self.assertIsInstance(token, MultiToken)
+        self.assertIn('name', token.get_deferred_fields())
+        self.assertEqual(token.name, "token name")
+
+    def test_lazy_token_can_be_cached(self):
+        """ lazy tokens can be pickled, e.g. by CachedMultiTokenAuthentication """
+        user, token = CachedMultiTokenAuthentication().authenticate_credentials(self.token.key)
+        token = pickle.loads(pickle.dumps(token))
+
+        self.assertEqual(token.key, self.token.key)
+        self.assertEqual(token.name, "token name")
+
+    def test_invalid_key(self):
+        """ the lean lookup raises DoesNotExist for unknown keys """
+        with self.assertRaises(MultiToken.DoesNotExist):
+            MultiToken.objects.get_lean(MultiToken.generate_key())
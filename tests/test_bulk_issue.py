@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from drf_multitokenauth.coreauthentication import CachedMultiTokenAuthentication, MultiTokenAuthentication
+from drf_multitokenauth.models import MultiToken
+
+
+class BulkIssueTestCase(TestCase):
+    """
+    Test Cases for issuing tokens in bulk
+    """
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user("user{}".format(i), password="secret") for i in range(5)]
+
+    def test_bulk_issue(self):
+        """ tokens are created in batches, and can be used right away """
+        with self.assertNumQueries(3):
+            tokens = list(MultiToken.objects.bulk_issue(self.users, name='service', batch_size=2))
+
+        self.assertEqual(len(tokens), 5)
+        self.assertEqual(len({token.key for token in tokens}), 5)
+        for user, token in zip(self.users, tokens):
+            self.assertEqual(token.user, user)
+            self.assertEqual(token.name, 'service')
+            self.assertEqual(MultiTokenAuthentication().authenticate_credentials(token.key)[0], user)
+
+    def test_bulk_issue_specs(self):
+        """ field values can be given per token """
+        tokens = list(MultiToken.objects.bulk_issue([
+            {'user': self.users[0], 'name': 'a', 'user_agent': 'agent'},
+            {'user': self.users[1]},
+        ], name='default'))
+
+        self.assertEqual([token.name for token in tokens], ['a', 'default'])
+        self.assertEqual(MultiToken.objects.get(pk=tokens[0].pk).user_agent, 'agent')
+
+    def test_bulk_issue_is_lazy(self):
+        """ users are consumed batch by batch """
+        consumed = []
+
+        def users():
+            for user in self.users:
+                consumed.append(user)
+                yield user
+
+        tokens = MultiToken.objects.bulk_issue(users(), batch_size=2)
+        next(tokens)
+        self.assertEqual(len(consumed), 2)
+
+    def test_prewarm(self):
+        """ with prewarm, the tokens are cached right away """
+        tokens = list(MultiToken.objects.bulk_issue(self.users, prewarm=True))
+
+        with self.assertNumQueries(0):
+            CachedMultiTokenAuthentication().authenticate_credentials(tokens[0].key)
+
+    @override_settings(AUTH_TOKEN_KEY_STORAGE='digest')
+    def test_bulk_issue_digest(self):
+        """ only digests are stored with AUTH_TOKEN_KEY_STORAGE = 'digest' """
+        token = next(MultiToken.objects.bulk_issue(self.users))
+
+        self.assertIsNone(MultiToken.objects.get(pk=token.pk).key)
+        self.assertEqual(MultiTokenAuthentication().authenticate_credentials(token.key)[1].pk, token.pk)
+
+
+class IssueTokensTestCase(TestCase):
+    """
+    Test Cases for the issue_tokens management command
+    """
+    def setUp(self):
+        self.users = [User.objects.create_user("user{}".format(i), password="secret") for i in range(3)]
+
+    def test_issue_tokens(self):
+        """ the created keys are written as JSON lines """
+        out, err = StringIO(), StringIO()
+        call_command('issue_tokens', 'user0', 'user1', 'unknown', count=2, name='ci', stdout=out, stderr=err)
+
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([line['username'] for line in lines], ['user0', 'user0', 'user1', 'user1'])
+        for line in lines:
+            self.assertEqual(MultiToken.objects.get(key=line['key']).user_id, line['user_id'])
+            self.assertEqual(line['name'], 'ci')
+        self.assertIn('User unknown does not exist', err.getvalue())
+        self.assertIn('Issued 4 tokens', err.getvalue())
+
+    def test_issue_tokens_files(self):
+        """ usernames can be read from a file, and keys written to a file """
+        with tempfile.TemporaryDirectory() as directory:
+            usernames_file = os.path.join(directory, 'usernames.txt')
+            output = os.path.join(directory, 'tokens.jsonl')
+            with open(usernames_file, 'w') as f:
+                f.write('user0\nuser2\n\n')
+
+            call_command(
+                'issue_tokens', usernames_file=usernames_file, output=output, batch_size=1, stdout=StringIO(),
+                stderr=StringIO()
+            )
+
+            with open(output) as f:
+                self.assertEqual([json.loads(line)['username'] for line in f], ['user0', 'user2'])
+        self.assertEqual(MultiToken.objects.count(), 2)
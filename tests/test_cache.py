@@ -0,0 +1,347 @@
+import threading
+import time
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.exceptions import AuthenticationFailed
+
+from drf_multitokenauth.cache import (
+    SingleFlight, bump_generation, get_cache_key, get_cached_credentials, get_or_load_credentials, get_user_generation,
+    invalidate_users, local_token_cache, should_refresh_early
+)
+from drf_multitokenauth.coreauthentication import CachedMultiTokenAuthentication, MultiTokenAuthentication
+from drf_multitokenauth.models import MultiToken
+from drf_multitokenauth.services import revoke_token, revoke_tokens
+
+
+class CachedAuthenticationTestCase(TestCase):
+    """
+    Test Cases for the cached token authentication and its invalidation
+    """
+    def setUp(self):
+        cache.clear()
+        self.authentication = CachedMultiTokenAuthentication()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.token = MultiToken.objects.create(user=self.user)
+
+    def test_revocation_during_load(self):
+        """ credentials which have been loaded before a concurrent revocation are not cached """
+        get_user_generation(self.user.pk)
+
+        def loader():
+            credentials = MultiTokenAuthentication().authenticate_credentials(self.token.key)
+            # e.g. logout everywhere in another process, after the token has been read
+            MultiToken.objects.filter(pk=self.token.pk).delete_without_signals()
+            invalidate_users([self.user.pk])
+            return credentials
+
+        get_or_load_credentials(self.token.key, loader)
+
+        self.assertIsNone(get_cached_credentials(self.token.key))
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_single_revocation_during_load(self):
+        """ credentials which have been loaded before a concurrent logout are not cached """
+        def loader():
+            credentials = MultiTokenAuthentication().authenticate_credentials(self.token.key)
+            # e.g. logout in another process, after the token has been read
+            revoke_token(self.token)
+            return credentials
+
+        get_or_load_credentials(self.token.key, loader)
+
+        self.assertIsNone(get_cached_credentials(self.token.key))
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_cache_hit_does_not_query_database(self):
+        """ a cached token is authenticated without any database query """
+        user, token = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+        self.assertEqual(token, self.token)
+
+        with self.assertNumQueries(0):
+            user, token = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+
+    def test_raw_key_is_not_used_as_cache_key(self):
+        """ the cache key is derived from the token key, but does not contain it """
+        self.authentication.authenticate_credentials(self.token.key)
+        self.assertNotIn(self.token.key, get_cache_key(self.token.key))
+        self.assertIsNotNone(cache.get(get_cache_key(self.token.key)))
+
+    def test_deleted_token_is_evicted(self):
+        """ deleting a token removes it from the cache """
+        self.authentication.authenticate_credentials(self.token.key)
+        self.token.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_queryset_delete_evicts_tokens(self):
+        """ deleting tokens via a queryset (e.g. admin, logout) removes them from the cache """
+        self.authentication.authenticate_credentials(self.token.key)
+        MultiToken.objects.filter(user=self.user).delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_deactivated_user_is_evicted(self):
+        """ deactivating a user removes all tokens of the user from the cache """
+        self.authentication.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_password_change_evicts_tokens(self):
+        """ changing the password removes all tokens of the user from the cache """
+        self.authentication.authenticate_credentials(self.token.key)
+        self.user.set_password("secret2")
+        self.user.save(update_fields=['password'])
+
+        self.assertIsNone(get_cached_credentials(self.token.key))
+
+    def test_last_login_update_keeps_tokens(self):
+        """ saving unrelated user fields keeps the cached tokens """
+        self.authentication.authenticate_credentials(self.token.key)
+        self.user.save(update_fields=['last_login'])
+
+        self.assertIsNotNone(get_cached_credentials(self.token.key))
+
+    def test_invalidate_users(self):
+        """ invalidating a user ignores all cached tokens of the user, without deleting them one by one """
+        self.authentication.authenticate_credentials(self.token.key)
+        invalidate_users([self.user.pk])
+
+        self.assertIsNone(get_cached_credentials(self.token.key))
+        with self.assertNumQueries(1):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_evicted_user_generation_invalidates_tokens(self):
+        """ if the generation of a user is evicted from the cache, the cached tokens of the user are ignored """
+        self.authentication.authenticate_credentials(self.token.key)
+        cache.delete('drf_multitokenauth:user:{}:generation'.format(self.user.pk))
+
+        self.assertIsNone(get_cached_credentials(self.token.key))
+
+
+@override_settings(AUTH_TOKEN_LOCAL_CACHE_MAX_ENTRIES=2, AUTH_TOKEN_LOCAL_CACHE_TIMEOUT=60)
+class LocalCacheTestCase(TestCase):
+    """
+    Test Cases for the per-process LRU cache in front of the django cache
+    """
+    def setUp(self):
+        cache.clear()
+        local_token_cache.clear()
+        self.authentication = CachedMultiTokenAuthentication()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.tokens = [MultiToken.objects.create(user=self.user) for i in range(3)]
+
+    def tearDown(self):
+        local_token_cache.clear()
+
+    def test_local_cache_hit(self):
+        """ a token in the local cache is served without querying the database or the django cache """
+        key = self.tokens[0].key
+        self.authentication.authenticate_credentials(key)
+        cache.clear()
+
+        with self.assertNumQueries(0):
+            user, token = self.authentication.authenticate_credentials(key)
+        self.assertEqual(token, self.tokens[0])
+        self.assertEqual(local_token_cache.stats()['hits'], 1)
+
+    def test_local_cache_evicts_least_recently_used(self):
+        """ the local cache is bounded by AUTH_TOKEN_LOCAL_CACHE_MAX_ENTRIES """
+        for token in self.tokens:
+            self.authentication.authenticate_credentials(token.key)
+
+        stats = local_token_cache.stats()
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertIsNone(local_token_cache.get(get_cache_key(self.tokens[0].key)))
+
+    def test_revocation_clears_local_entry(self):
+        """ deleting a token removes it from the local cache of this process """
+        key = self.tokens[0].key
+        self.authentication.authenticate_credentials(key)
+        self.tokens[0].delete()
+
+        self.assertIsNone(local_token_cache.get(get_cache_key(key)))
+        self.assertEqual(cache.get('drf_multitokenauth:generation'), 1)
+
+    def test_invalidate_users_clears_local_entries(self):
+        """ invalidating a user drops the user's tokens from the local cache of this process """
+        self.authentication.authenticate_credentials(self.tokens[0].key)
+        invalidate_users([self.user.pk])
+
+        self.assertEqual(local_token_cache.stats()['size'], 0)
+
+    def test_generation_bump_clears_local_cache(self):
+        """ a revocation in another process drops the local cache once the generation is checked again """
+        key = self.tokens[0].key
+        self.authentication.authenticate_credentials(key)
+        bump_generation()
+
+        # still served locally until the generation is checked again
+        self.assertIsNotNone(local_token_cache.get(get_cache_key(key)))
+
+        local_token_cache._generation_checked_at = None
+        self.assertIsNone(local_token_cache.get(get_cache_key(key)))
+
+
+class StampedeProtectionTestCase(TestCase):
+    """
+    Test Cases for coalescing concurrent cache misses and early refreshes
+    """
+    def setUp(self):
+        cache.clear()
+        self.authentication = CachedMultiTokenAuthentication()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.token = MultiToken.objects.create(user=self.user)
+
+    def test_single_flight_coalesces_concurrent_calls(self):
+        """ concurrent calls with the same key only execute the function once """
+        single_flight = SingleFlight()
+        barrier = threading.Barrier(5)
+        calls = []
+        results = []
+
+        def load():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'credentials'
+
+        def worker():
+            barrier.wait()
+            results.append(single_flight.do('key', load))
+
+        threads = [threading.Thread(target=worker) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['credentials'] * 5)
+
+    def test_single_flight_shares_exceptions(self):
+        """ exceptions of the function are propagated, and the key is released afterwards """
+        single_flight = SingleFlight()
+
+        def load():
+            raise AuthenticationFailed()
+
+        with self.assertRaises(AuthenticationFailed):
+            single_flight.do('key', load)
+        self.assertEqual(single_flight.do('key', lambda: 'credentials'), 'credentials')
+
+    @override_settings(AUTH_TOKEN_CACHE_EARLY_REFRESH_BETA=1.0)
+    def test_early_refresh(self):
+        """ entries are refreshed early when they are about to expire """
+        self.assertTrue(should_refresh_early(60.0, time.time()))
+        self.assertFalse(should_refresh_early(0.0, time.time() + 60))
+
+    @override_settings(AUTH_TOKEN_CACHE_EARLY_REFRESH_BETA=0)
+    def test_early_refresh_disabled(self):
+        """ early refreshes can be disabled """
+        self.assertFalse(should_refresh_early(60.0, time.time()))
+
+    @override_settings(AUTH_TOKEN_CACHE_LOCK_TIMEOUT=5, AUTH_TOKEN_CACHE_EARLY_REFRESH_BETA=1000)
+    def test_locked_refresh_returns_stale_entry(self):
+        """ while another process refreshes an entry, the stale entry is used instead of querying the database """
+        user, token = self.authentication.authenticate_credentials(self.token.key)
+        cache_key = get_cache_key(self.token.key)
+        generation = cache.get(cache_key)[3]
+        cache.set(cache_key, ((user, token), 1.0, time.time(), generation), 60)
+        cache.add(cache_key + ':lock', 1, 5)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authentication.authenticate_credentials(self.token.key), (user, token))
+
+    @override_settings(AUTH_TOKEN_CACHE_LOCK_TIMEOUT=5)
+    def test_failed_lock_holder_does_not_block(self):
+        """ a waiting process loads the token itself once the lock is released without a cache entry """
+        cache_key = get_cache_key(self.token.key)
+        cache.add(cache_key + ':lock', 1, 5)
+        threading.Timer(0.1, cache.delete, [cache_key + ':lock']).start()
+
+        started_at = time.monotonic()
+        user, token = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(token, self.token)
+        self.assertLess(time.monotonic() - started_at, 5)
+
+
+    @override_settings(AUTH_TOKEN_CACHE_LOCK_TIMEOUT=5)
+    def test_waiting_ignores_revoked_entry(self):
+        """ a waiting process does not return the entry of a token which has been revoked in the meantime """
+        self.authentication.authenticate_credentials(self.token.key)
+        cache_key = get_cache_key(self.token.key)
+        cache.add(cache_key + ':lock', 1, 5)
+        revoke_tokens(user=self.user)
+        threading.Timer(0.1, cache.delete, [cache_key + ':lock']).start()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+@override_settings(AUTH_TOKEN_NEGATIVE_CACHE_TIMEOUT=60)
+class NegativeCacheTestCase(TestCase):
+    """
+    Test Cases for the negative cache of unknown token keys
+    """
+    def setUp(self):
+        cache.clear()
+        self.authentication = MultiTokenAuthentication()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.invalid_key = MultiToken.generate_key()
+
+    def assertInvalid(self, key):
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(key)
+
+    def test_invalid_key_is_rejected_without_query(self):
+        """ a key which has not been found once is rejected without querying the database """
+        with self.assertNumQueries(1):
+            self.assertInvalid(self.invalid_key)
+        with self.assertNumQueries(0):
+            self.assertInvalid(self.invalid_key)
+
+    @override_settings(AUTH_TOKEN_NEGATIVE_CACHE_TIMEOUT=0)
+    def test_negative_cache_disabled(self):
+        """ without AUTH_TOKEN_NEGATIVE_CACHE_TIMEOUT every invalid key is looked up """
+        self.assertInvalid(self.invalid_key)
+        with self.assertNumQueries(1):
+            self.assertInvalid(self.invalid_key)
+
+    def test_created_token_is_not_rejected(self):
+        """ creating a token removes its key from the negative cache """
+        self.assertInvalid(self.invalid_key)
+        token = MultiToken.objects.create(user=self.user, key=self.invalid_key)
+
+        user, authenticated_token = self.authentication.authenticate_credentials(self.invalid_key)
+        self.assertEqual(authenticated_token, token)
+
+    def test_inactive_user_is_not_cached_as_invalid(self):
+        """ tokens of inactive users are not remembered as invalid keys """
+        token = MultiToken.objects.create(user=self.user)
+        self.user.is_active = False
+        self.user.save()
+        self.assertInvalid(token.key)
+
+        self.user.is_active = True
+        self.user.save()
+        self.authentication.authenticate_credentials(token.key)
+
+    def test_reset_command(self):
+        """ the reset_invalid_tokens command forgets all invalid keys """
+        self.assertInvalid(self.invalid_key)
+        call_command('reset_invalid_tokens', stdout=StringIO())
+
+        with self.assertNumQueries(1):
+            self.assertInvalid(self.invalid_key)
@@ -0,0 +1,126 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+
+from drf_multitokenauth.cache import get_cache_key
+from drf_multitokenauth.coreauthentication import CachedMultiTokenAuthentication, MultiTokenAuthentication
+from drf_multitokenauth.models import MultiToken
+
+
+class ExpiryTestCase(TestCase):
+    """
+    Test Cases for absolute and sliding token expiry
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.now = timezone.now()
+
+    def assertExpired(self, token, authentication_class=MultiTokenAuthentication):
+        with self.assertRaisesMessage(AuthenticationFailed, 'Token has expired.'):
+            authentication_class().authenticate_credentials(token.key)
+
+    @override_settings(AUTH_TOKEN_EXPIRY=3600)
+    def test_default_expiry(self):
+        """ AUTH_TOKEN_EXPIRY sets the expiry date of new tokens """
+        token = MultiToken.objects.create(user=self.user)
+        self.assertAlmostEqual(token.expires, self.now + timedelta(hours=1), delta=timedelta(minutes=1))
+
+    def test_no_default_expiry(self):
+        """ tokens do not expire by default """
+        token = MultiToken.objects.create(user=self.user)
+        self.assertIsNone(token.expires)
+        MultiTokenAuthentication().authenticate_credentials(token.key)
+
+    def test_absolute_expiry(self):
+        """ tokens can't be used after their expiry date """
+        token = MultiToken.objects.create(user=self.user, expires=self.now - timedelta(seconds=1))
+        self.assertExpired(token)
+
+    @override_settings(AUTH_TOKEN_LEAN_LOOKUP=True)
+    def test_absolute_expiry_lean(self):
+        """ the lean lookup loads the fields needed to check the expiry """
+        token = MultiToken.objects.create(user=self.user, expires=self.now - timedelta(seconds=1))
+        with self.assertNumQueries(1):
+            self.assertExpired(token)
+
+    def test_cached_token_expires(self):
+        """ cached tokens are checked for expiry on every cache hit """
+        token = MultiToken.objects.create(user=self.user, expires=self.now + timedelta(hours=1))
+        authentication = CachedMultiTokenAuthentication()
+        user, cached_token = authentication.authenticate_credentials(token.key)
+
+        generation = cache.get(get_cache_key(token.key))[3]
+        cached_token.expires = self.now - timedelta(seconds=1)
+        cache.set(get_cache_key(token.key), ((user, cached_token), 0.0, 2 ** 40, generation), 60)
+        self.assertExpired(token, CachedMultiTokenAuthentication)
+
+    @override_settings(AUTH_TOKEN_SLIDING_EXPIRY=3600)
+    def test_sliding_expiry(self):
+        """ tokens expire after AUTH_TOKEN_SLIDING_EXPIRY seconds without usage """
+        token = MultiToken.objects.create(user=self.user, last_used=self.now - timedelta(minutes=30))
+        MultiTokenAuthentication().authenticate_credentials(token.key)
+
+        MultiToken.objects.filter(pk=token.pk).update(last_used=self.now - timedelta(hours=2))
+        self.assertExpired(token)
+
+    @override_settings(AUTH_TOKEN_SLIDING_EXPIRY=3600)
+    def test_sliding_expiry_of_unused_token(self):
+        """ tokens which have never been used expire relative to their creation """
+        token = MultiToken.objects.create(user=self.user)
+        MultiToken.objects.filter(pk=token.pk).update(created=self.now - timedelta(hours=2))
+        self.assertExpired(token)
+
+
+class PurgeExpiredTokensTestCase(TestCase):
+    """
+    Test Cases for the purge_expired_tokens management command
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        past = timezone.now() - timedelta(seconds=1)
+        self.expired = [MultiToken.objects.create(user=self.user, expires=past) for i in range(3)]
+        self.valid = MultiToken.objects.create(user=self.user)
+
+    def purge(self, *args):
+        out = StringIO()
+        call_command('purge_expired_tokens', *args, stdout=out)
+        return out.getvalue()
+
+    def test_purge(self):
+        """ expired tokens are deleted in batches """
+        output = self.purge('--batch-size', '2')
+
+        self.assertEqual(list(MultiToken.objects.all()), [self.valid])
+        self.assertIn('Deleted 2 expired tokens (last id: {})'.format(self.expired[1].pk), output)
+        self.assertIn('Deleted 3 expired tokens', output)
+
+    def test_purge_evicts_cached_tokens(self):
+        """ purged tokens are evicted from the token cache """
+        # cache the token while it is still valid
+        MultiToken.objects.filter(pk=self.expired[0].pk).update(expires=None)
+        CachedMultiTokenAuthentication().authenticate_credentials(self.expired[0].key)
+        MultiToken.objects.filter(pk=self.expired[0].pk).update(expires=timezone.now())
+
+        self.purge()
+        self.assertIsNone(cache.get(get_cache_key(self.expired[0].key)))
+
+    def test_dry_run(self):
+        """ a dry run does not delete any token """
+        output = self.purge('--dry-run')
+
+        self.assertEqual(MultiToken.objects.count(), 4)
+        self.assertIn('Found 3 expired tokens', output)
+
+    def test_resume(self):
+        """ --after skips tokens which have already been processed """
+        self.purge('--after', str(self.expired[0].pk))
+
+        self.assertEqual(set(MultiToken.objects.all()), {self.expired[0], self.valid})
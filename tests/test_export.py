@@ -0,0 +1,68 @@
+import csv
+import json
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from drf_multitokenauth.models import MultiToken
+
+
+class ExportTestCase(APITestCase):
+    """
+    Test Cases for exporting tokens
+    """
+    def setUp(self):
+        self.user1 = User.objects.create_user("user1", password="secret")
+        self.user2 = User.objects.create_user("user2", password="secret")
+        self.staff = User.objects.create_user("staff", password="secret", is_staff=True)
+        self.token1 = MultiToken.objects.create(user=self.user1, name='phone', user_agent='agent')
+        self.token2 = MultiToken.objects.create(user=self.user2, name='ci')
+        MultiToken.objects.filter(pk=self.token2.pk).update(created=timezone.now() - timedelta(days=10))
+
+    def test_export_csv(self):
+        """ tokens are exported as CSV, without their keys """
+        out = StringIO()
+        call_command('export_tokens', chunk_size=1, stdout=out)
+
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual([row['username'] for row in rows], ['user1', 'user2'])
+        self.assertEqual((rows[0]['name'], rows[0]['user_agent']), ('phone', 'agent'))
+        self.assertNotIn('key', rows[0])
+        self.assertNotIn(self.token1.key, out.getvalue())
+
+    def test_export_jsonl_filters(self):
+        """ tokens can be filtered by user, name and creation date """
+        out = StringIO()
+        call_command('export_tokens', format='jsonl', created_before=timezone.now().date().isoformat(), stdout=out)
+        self.assertEqual([json.loads(line)['id'] for line in out.getvalue().splitlines()], [self.token2.pk])
+
+        out = StringIO()
+        call_command('export_tokens', format='jsonl', user_id=self.user1.pk, name='phone', stdout=out)
+        self.assertEqual([json.loads(line)['id'] for line in out.getvalue().splitlines()], [self.token1.pk])
+
+        with self.assertRaises(CommandError):
+            call_command('export_tokens', created_after='yesterday', stdout=StringIO())
+
+    def test_export_view(self):
+        """ staff users can stream the export """
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(reverse('auth-export'), {'export_format': 'jsonl', 'name': 'ci'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['username'] for line in lines], ['user2'])
+
+        response = self.client.get(reverse('auth-export'), {'created_after': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_view_requires_staff(self):
+        self.client.force_authenticate(self.user1)
+        response = self.client.get(reverse('auth-export'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
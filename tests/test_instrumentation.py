@@ -0,0 +1,115 @@
+import unittest
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from drf_multitokenauth import instrumentation
+from drf_multitokenauth.coreauthentication import CachedMultiTokenAuthentication
+from drf_multitokenauth.instrumentation import (
+    Instrumentation, NullInstrumentation, PrometheusInstrumentation, get_instrumentation
+)
+from drf_multitokenauth.models import MultiToken
+
+
+class RecordingInstrumentation(Instrumentation):
+    """ records all counters and timers """
+    def __init__(self):
+        self.counters = []
+        self.timers = []
+
+    def increment(self, name, value=1, **labels):
+        self.counters.append((name, labels))
+
+    def observe(self, name, seconds, **labels):
+        self.timers.append(name)
+
+
+@override_settings(AUTH_TOKEN_INSTRUMENTATION='{}.RecordingInstrumentation'.format(__name__))
+class InstrumentationTestCase(APITestCase):
+    """
+    Test Cases for the instrumentation of the hot paths
+    """
+    def setUp(self):
+        cache.clear()
+        self.instrumentation = get_instrumentation()
+        self.instrumentation.counters.clear()
+        self.instrumentation.timers.clear()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+
+    def test_configured_instrumentation(self):
+        self.assertIsInstance(self.instrumentation, RecordingInstrumentation)
+        # the instrumentation is instantiated once
+        self.assertIs(get_instrumentation(), self.instrumentation)
+
+    def test_login_and_logout(self):
+        response = self.client.post(
+            reverse('multi_token_auth:auth-login'), {'username': 'user1', 'password': 'secret1'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.instrumentation.timers, ['login_password_check', 'signal_dispatch', 'token_insert', 'signal_dispatch']
+        )
+        self.assertEqual(self.instrumentation.counters, [('logins', {'result': 'success'})])
+
+        self.instrumentation.timers.clear()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + response.data['token'])
+        response = self.client.post(reverse('multi_token_auth:auth-logout'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.instrumentation.timers, ['token_lookup', 'authenticate', 'logout_delete'])
+
+    def test_invalid_login(self):
+        response = self.client.post(
+            reverse('multi_token_auth:auth-login'), {'username': 'user1', 'password': 'wrong'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.instrumentation.counters, [('logins', {'result': 'invalid'})])
+
+    def test_token_cache(self):
+        token = MultiToken.objects.create(user=self.user)
+        authentication = CachedMultiTokenAuthentication()
+
+        authentication.authenticate_credentials(token.key)
+        authentication.authenticate_credentials(token.key)
+
+        self.assertEqual(self.instrumentation.counters, [
+            ('token_cache', {'result': 'miss'}), ('token_cache', {'result': 'hit'}),
+        ])
+        self.assertEqual(
+            self.instrumentation.timers, ['token_cache_get', 'token_lookup', 'token_cache_set', 'token_cache_get']
+        )
+
+
+class NullInstrumentationTestCase(TestCase):
+    def test_default(self):
+        null_instrumentation = get_instrumentation()
+        self.assertIsInstance(null_instrumentation, NullInstrumentation)
+        # timers are shared and measure nothing
+        self.assertIs(null_instrumentation.timer('authenticate'), null_instrumentation.timer('token_lookup'))
+
+
+@unittest.skipIf(instrumentation.prometheus_client is None, 'prometheus_client is not installed')
+class PrometheusInstrumentationTestCase(TestCase):
+    def test_metrics(self):
+        registry = instrumentation.prometheus_client.CollectorRegistry()
+        prometheus = PrometheusInstrumentation(registry)
+
+        prometheus.increment('logins', result='success')
+        with prometheus.timer('token_lookup'):
+            pass
+
+        self.assertEqual(
+            registry.get_sample_value('drf_multitokenauth_logins_total', {'result': 'success'}), 1
+        )
+        self.assertEqual(registry.get_sample_value('drf_multitokenauth_token_lookup_seconds_count'), 1)
+
+
+@unittest.skipIf(instrumentation.prometheus_client is not None, 'prometheus_client is installed')
+class PrometheusInstrumentationMissingTestCase(TestCase):
+    def test_missing_prometheus_client(self):
+        with self.assertRaises(ImproperlyConfigured):
+            PrometheusInstrumentation()
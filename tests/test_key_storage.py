@@ -0,0 +1,128 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from rest_framework.exceptions import AuthenticationFailed
+
+from drf_multitokenauth.coreauthentication import CachedMultiTokenAuthentication, MultiTokenAuthentication
+from drf_multitokenauth.models import MultiToken, hash_key
+from drf_multitokenauth.services import introspect_tokens, issue_token, revoke_token, rotate_token
+
+
+class KeyStorageTestCase(TestCase):
+    """
+    Test Cases for storing digests of token keys
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+
+    @override_settings(AUTH_TOKEN_KEY_STORAGE='transition')
+    def test_transition(self):
+        """ during the transition, both the key and the digest are stored, and both are accepted """
+        with override_settings(AUTH_TOKEN_KEY_STORAGE='plain'):
+            plain_token = MultiToken.objects.create(user=self.user)
+        token = MultiToken.objects.create(user=self.user)
+
+        self.assertIsNone(MultiToken.objects.get(pk=plain_token.pk).digest)
+        self.assertEqual(bytes(MultiToken.objects.get(pk=token.pk).digest), hash_key(token.key))
+
+        for key in (plain_token.key, token.key):
+            with self.assertNumQueries(1):
+                self.assertEqual(MultiTokenAuthentication().authenticate_credentials(key)[1].key, key)
+
+    @override_settings(AUTH_TOKEN_KEY_STORAGE='digest')
+    def test_digest(self):
+        """ only the digest is stored, and tokens are looked up by it """
+        token = MultiToken.objects.create(user=self.user)
+        self.assertEqual(len(token.key), 64)
+        self.assertIsNone(MultiToken.objects.get(pk=token.pk).key)
+
+        user, authenticated = MultiTokenAuthentication().authenticate_credentials(token.key)
+        self.assertEqual(authenticated.pk, token.pk)
+        self.assertEqual(authenticated.key, token.key)
+
+        with override_settings(AUTH_TOKEN_LEAN_LOOKUP=True):
+            self.assertEqual(MultiTokenAuthentication().authenticate_credentials(token.key)[1], token)
+
+        with self.assertRaises(AuthenticationFailed):
+            MultiTokenAuthentication().authenticate_credentials(MultiToken.generate_key())
+
+    @override_settings(AUTH_TOKEN_KEY_STORAGE='digest')
+    def test_digest_cache_invalidation(self):
+        """ tokens loaded from the database are evicted from the token cache by their digest """
+        token = MultiToken.objects.create(user=self.user)
+        authentication = CachedMultiTokenAuthentication()
+        authentication.authenticate_credentials(token.key)
+
+        MultiToken.objects.get(pk=token.pk).delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate_credentials(token.key)
+
+    @override_settings(AUTH_TOKEN_KEY_STORAGE='digest')
+    def test_digest_services(self):
+        """ the services find tokens by their digest """
+        token = MultiToken.objects.create(user=self.user, name='ci')
+
+        self.assertTrue(introspect_tokens([token.key])[token.key]['active'])
+
+        # tokens without a stored key can't be reused
+        self.assertNotEqual(issue_token(self.user, reuse=True, name='ci'), token)
+
+        new_key = rotate_token(token)
+        self.assertEqual(MultiTokenAuthentication().authenticate_credentials(new_key)[1].pk, token.pk)
+
+        self.assertTrue(revoke_token(MultiToken.objects.get(pk=token.pk)))
+        self.assertFalse(MultiToken.objects.filter(pk=token.pk).exists())
+
+    @override_settings(AUTH_TOKEN_KEY_STORAGE='digest', AUTH_TOKEN_LEAN_LOOKUP=True)
+    def test_digest_rotate_lean_token(self):
+        """ tokens of the lean lookup can be rotated """
+        token = MultiToken.objects.create(user=self.user)
+        user, lean_token = MultiTokenAuthentication().authenticate_credentials(token.key)
+
+        new_key = rotate_token(lean_token)
+
+        self.assertEqual(lean_token.key, new_key)
+        self.assertEqual(bytes(lean_token.digest), hash_key(new_key))
+        self.assertEqual(MultiTokenAuthentication().authenticate_credentials(new_key)[1].pk, token.pk)
+
+
+class MigrateTokenDigestsTestCase(TestCase):
+    """
+    Test Cases for the migrate_token_digests management command
+    """
+    def setUp(self):
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.tokens = [MultiToken.objects.create(user=self.user) for i in range(5)]
+
+    def test_requires_digest_storage(self):
+        """ digests are only stored once they are used """
+        with self.assertRaises(CommandError):
+            call_command('migrate_token_digests', stdout=StringIO())
+
+    @override_settings(AUTH_TOKEN_KEY_STORAGE='transition')
+    def test_migrate(self):
+        """ digests of existing keys are stored in batches (3 batches, plus the final empty select) """
+        out = StringIO()
+        with self.assertNumQueries(7):
+            call_command('migrate_token_digests', batch_size=2, stdout=out)
+
+        self.assertIn('Stored 5 digests', out.getvalue())
+        for token in self.tokens:
+            self.assertEqual(bytes(MultiToken.objects.get(pk=token.pk).digest), hash_key(token.key))
+
+        with self.assertRaises(CommandError):
+            call_command('migrate_token_digests', clear_keys=True, stdout=StringIO())
+
+    @override_settings(AUTH_TOKEN_KEY_STORAGE='digest')
+    def test_clear_keys(self):
+        """ keys are removed after their digests have been stored """
+        call_command('migrate_token_digests', clear_keys=True, stdout=StringIO())
+
+        self.assertFalse(MultiToken.objects.filter(key__isnull=False).exists())
+        for token in self.tokens:
+            self.assertEqual(MultiTokenAuthentication().authenticate_credentials(token.key)[1].pk, token.pk)
@@ -0,0 +1,86 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from drf_multitokenauth.coreauthentication import DualReadMultiTokenAuthentication, MultiTokenAuthentication
+from drf_multitokenauth.models import MultiToken
+
+
+class MigrateAuthtokenTestCase(TestCase):
+    """
+    Test Cases for the migrate_authtoken management command
+    """
+    def setUp(self):
+        self.users = [User.objects.create_user("user{}".format(i), password="secret") for i in range(5)]
+        self.legacy_tokens = [Token.objects.create(user=user) for user in self.users]
+        self.created = timezone.now() - timedelta(days=100)
+        Token.objects.update(created=self.created)
+
+    def test_migrate(self):
+        """ legacy tokens are copied in batches, keeping their creation date """
+        out = StringIO()
+        call_command('migrate_authtoken', batch_size=2, name='legacy', stdout=out)
+
+        self.assertIn('Copied 5 tokens', out.getvalue())
+        self.assertEqual(MultiToken.objects.count(), 5)
+        for legacy_token in self.legacy_tokens:
+            token = MultiToken.objects.get(key=legacy_token.key)
+            self.assertEqual((token.user_id, token.created, token.name), (legacy_token.user_id, self.created, 'legacy'))
+            self.assertEqual(MultiTokenAuthentication().authenticate_credentials(legacy_token.key)[1], token)
+
+    @override_settings(AUTH_TOKEN_NEGATIVE_CACHE_TIMEOUT=60)
+    def test_migrate_forgets_invalid_keys(self):
+        """ keys which have been presented before they were copied are accepted afterwards """
+        cache.clear()
+        key = self.legacy_tokens[0].key
+        with self.assertRaises(AuthenticationFailed):
+            MultiTokenAuthentication().authenticate_credentials(key)
+
+        call_command('migrate_authtoken', stdout=StringIO())
+
+        self.assertEqual(MultiTokenAuthentication().authenticate_credentials(key)[1].key, key)
+
+    def test_resume(self):
+        """ interrupted runs can be resumed; tokens which have been copied already are skipped """
+        keys = sorted(token.key for token in self.legacy_tokens)
+        call_command('migrate_authtoken', stdout=StringIO())
+        MultiToken.objects.filter(key__in=keys[3:]).delete()
+
+        out = StringIO()
+        call_command('migrate_authtoken', after=keys[1][:8], stdout=out)
+
+        # the token of the reported key prefix is processed again
+        self.assertIn('Copied 4 tokens', out.getvalue())
+        self.assertEqual(MultiToken.objects.count(), 5)
+
+
+class DualReadAuthenticationTestCase(TestCase):
+    """
+    Test Cases for DualReadMultiTokenAuthentication
+    """
+    def setUp(self):
+        self.authentication = DualReadMultiTokenAuthentication()
+        self.user = User.objects.create_user("user1", password="secret")
+
+    def test_multi_token_first(self):
+        token = MultiToken.objects.create(user=self.user)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authentication.authenticate_credentials(token.key), (self.user, token))
+
+    def test_legacy_token(self):
+        """ keys which don't exist in MultiToken are looked up in the legacy table """
+        legacy_token = Token.objects.create(user=self.user)
+
+        with self.assertNumQueries(2):
+            self.assertEqual(self.authentication.authenticate_credentials(legacy_token.key), (self.user, legacy_token))
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(MultiToken.generate_key())
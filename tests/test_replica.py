@@ -0,0 +1,85 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.exceptions import AuthenticationFailed
+
+from drf_multitokenauth.coreauthentication import CachedMultiTokenAuthentication, MultiTokenAuthentication
+from drf_multitokenauth.models import MultiToken
+from drf_multitokenauth.services import revoke_token
+
+
+@override_settings(AUTH_TOKEN_READ_DATABASE='replica')
+class ReadDatabaseTestCase(TestCase):
+    """
+    Test Cases for token lookups on a read database
+
+    The replica is a separate database here, so tokens created on the primary database have "not been replicated".
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.authentication = MultiTokenAuthentication()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.token = MultiToken.objects.create(user=self.user)
+
+    def replicate(self):
+        User.objects.using('replica').bulk_create([self.user])
+        MultiToken.objects.using('replica').bulk_create([MultiToken.objects.get(pk=self.token.pk)])
+
+    def test_lookup_on_read_database(self):
+        """ replicated tokens are looked up on the read database only """
+        self.replicate()
+
+        with self.assertNumQueries(0, using='default'), self.assertNumQueries(1, using='replica'):
+            user, token = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(token.pk, self.token.pk)
+
+    @override_settings(AUTH_TOKEN_LEAN_LOOKUP=True)
+    def test_lean_lookup_on_read_database(self):
+        self.replicate()
+
+        with self.assertNumQueries(0, using='default'), self.assertNumQueries(1, using='replica'):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_primary_fallback(self):
+        """ tokens which have not been replicated yet are looked up on the primary database """
+        with self.assertNumQueries(1, using='default'), self.assertNumQueries(1, using='replica'):
+            user, token = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(token.pk, self.token.pk)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(MultiToken.generate_key())
+
+    def test_writes_on_primary(self):
+        """ tokens are revoked on the primary database """
+        self.replicate()
+        user, token = self.authentication.authenticate_credentials(self.token.key)
+
+        with self.assertNumQueries(0, using='replica'):
+            self.assertTrue(revoke_token(token, user))
+        self.assertFalse(MultiToken.objects.filter(pk=self.token.pk).exists())
+
+    def test_revoked_token_on_read_database(self):
+        """ revoked tokens are not accepted (or cached) from the read database before the deletion is replicated """
+        self.replicate()
+        authentication = CachedMultiTokenAuthentication()
+        user, token = authentication.authenticate_credentials(self.token.key)
+        self.assertTrue(revoke_token(token, user))
+
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate_credentials(self.token.key)
+
+        # the deletion is replicated
+        MultiToken.objects.using('replica').filter(pk=self.token.pk).delete()
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate_credentials(self.token.key)
+
+    @override_settings(AUTH_TOKEN_REVOCATION_TIMEOUT=0)
+    def test_revoked_token_on_read_database_without_timeout(self):
+        """ without AUTH_TOKEN_REVOCATION_TIMEOUT, tokens are read from the read database until it has caught up """
+        self.replicate()
+        revoke_token(self.token)
+
+        user, token = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(token.pk, self.token.pk)
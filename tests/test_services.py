@@ -0,0 +1,323 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+
+from drf_multitokenauth.cache import get_rotated_cache_key
+from drf_multitokenauth.coreauthentication import CachedMultiTokenAuthentication, MultiTokenAuthentication
+from drf_multitokenauth.models import MultiToken, MultiTokenQuerySet
+from drf_multitokenauth.services import (
+    introspect_tokens, issue_login_token, issue_token, record_last_login, revoke_token, revoke_tokens, rotate_token
+)
+
+
+class RevokeTokensTestCase(TestCase):
+    """
+    Test Cases for the bulk revocation of tokens
+    """
+    def setUp(self):
+        cache.clear()
+        self.user1 = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.user2 = User.objects.create_user("user2", "user2@mail.com", "secret2")
+        self.tokens1 = [MultiToken.objects.create(user=self.user1, name=str(i)) for i in range(3)]
+        self.token2 = MultiToken.objects.create(user=self.user2)
+
+    def test_revoke_user_tokens(self):
+        """ all tokens of a user are revoked with a single DELETE query """
+        with self.assertNumQueries(1):
+            self.assertEqual(revoke_tokens(user=self.user1), 3)
+
+        self.assertEqual(list(MultiToken.objects.all()), [self.token2])
+
+    def test_revoke_exclude_current(self):
+        """ the current token can be kept """
+        self.assertEqual(revoke_tokens(user=self.user1, exclude_current=self.tokens1[0]), 2)
+        self.assertEqual(set(MultiToken.objects.all()), {self.tokens1[0], self.token2})
+
+    def test_revoke_queryset(self):
+        """ tokens can be revoked by an arbitrary queryset """
+        revoked = revoke_tokens(queryset=MultiToken.objects.filter(name__in=['0', '1']))
+        self.assertEqual(revoked, 2)
+        self.assertEqual(set(MultiToken.objects.all()), {self.tokens1[2], self.token2})
+
+    def test_revoke_requires_user_or_queryset(self):
+        """ revoking without any filter is refused """
+        with self.assertRaises(ValueError):
+            revoke_tokens()
+
+    def test_revoked_tokens_are_not_cached(self):
+        """ cached tokens of the affected users are invalidated """
+        authentication = CachedMultiTokenAuthentication()
+        for token in self.tokens1 + [self.token2]:
+            authentication.authenticate_credentials(token.key)
+
+        revoke_tokens(queryset=MultiToken.objects.filter(user=self.user1))
+
+        for token in self.tokens1:
+            with self.assertRaises(AuthenticationFailed):
+                authentication.authenticate_credentials(token.key)
+        with self.assertNumQueries(0):
+            authentication.authenticate_credentials(self.token2.key)
+
+
+@override_settings(AUTH_TOKEN_MAX_PER_USER=3)
+class IssueTokenTestCase(TestCase):
+    """
+    Test Cases for issuing tokens with a per-user limit
+    """
+    def setUp(self):
+        cache.clear()
+        self.user1 = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.user2 = User.objects.create_user("user2", "user2@mail.com", "secret2")
+        self.tokens1 = [issue_token(self.user1, name=str(i)) for i in range(3)]
+        self.token2 = issue_token(self.user2)
+
+    def test_least_recently_used_token_is_evicted(self):
+        """ exceeding the limit revokes the least recently used token of the user """
+        # token 0 has been used recently, so token 1 is the least recently used one
+        MultiToken.objects.filter(pk=self.tokens1[0].pk).update(last_used=timezone.now())
+
+        token = issue_token(self.user1, name='new')
+
+        self.assertEqual(
+            sorted(self.user1.auth_tokens.values_list('name', flat=True)), ['0', '2', 'new']
+        )
+        self.assertEqual(token.name, 'new')
+        # tokens of other users are not affected
+        self.assertTrue(MultiToken.objects.filter(pk=self.token2.pk).exists())
+
+    def test_evicted_tokens_are_not_cached(self):
+        """ evicted tokens are removed from the token cache """
+        authentication = CachedMultiTokenAuthentication()
+        authentication.authenticate_credentials(self.tokens1[0].key)
+
+        issue_token(self.user1)
+
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate_credentials(self.tokens1[0].key)
+
+    @override_settings(AUTH_TOKEN_MAX_PER_USER=1)
+    def test_lower_limit_evicts_several_tokens(self):
+        """ if the limit has been lowered, all tokens exceeding it are evicted """
+        token = issue_token(self.user1)
+        self.assertEqual(list(self.user1.auth_tokens.all()), [token])
+
+    def test_reuse_token(self):
+        """ reusing a token needs a single query, and creates no token """
+        with self.assertNumQueries(1):
+            token = issue_token(self.user1, reuse=True, name='2')
+        self.assertEqual(token, self.tokens1[2])
+        self.assertEqual(self.user1.auth_tokens.count(), 3)
+
+    def test_expired_token_is_not_reused(self):
+        """ expired tokens are not reused """
+        MultiToken.objects.filter(pk=self.tokens1[2].pk).update(expires=timezone.now())
+
+        token = issue_token(self.user1, reuse=True, name='2')
+        self.assertNotEqual(token, self.tokens1[2])
+
+    def test_reuse_token_with_long_user_agent(self):
+        """ user agents are truncated before looking up a token to reuse, like they are when they are stored """
+        user_agent = 'a' * 300
+        token = issue_token(self.user1, reuse=True, name='long', user_agent=user_agent)
+
+        self.assertEqual(issue_token(self.user1, reuse=True, name='long', user_agent=user_agent), token)
+        self.assertEqual(self.user1.auth_tokens.filter(name='long').count(), 1)
+
+    @override_settings(AUTH_TOKEN_MAX_PER_USER=0)
+    def test_unlimited(self):
+        """ without a limit, tokens are just created """
+        with self.assertNumQueries(1):
+            issue_token(self.user1)
+        self.assertEqual(self.user1.auth_tokens.count(), 4)
+
+
+class RotateTokenTestCase(TestCase):
+    """
+    Test Cases for the rotation of tokens
+    """
+    def setUp(self):
+        cache.clear()
+        self.authentication = CachedMultiTokenAuthentication()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.token = MultiToken.objects.create(user=self.user, name="ci")
+        self.old_key = self.token.key
+
+    def test_rotate_single_update(self):
+        """ the key is replaced with a single UPDATE query """
+        with self.assertNumQueries(1):
+            new_key = rotate_token(self.token)
+
+        self.assertEqual(self.token.key, new_key)
+        self.assertEqual(MultiToken.objects.get().key, new_key)
+
+    def test_old_key_within_grace_period(self):
+        """ the old key is accepted during the grace period, also if it has been cached before """
+        self.authentication.authenticate_credentials(self.old_key)
+        rotate_token(self.token)
+
+        user, token = self.authentication.authenticate_credentials(self.old_key)
+        self.assertEqual(token.pk, self.token.pk)
+        self.assertEqual(token.key, self.token.key)
+
+    def test_old_key_after_grace_period(self):
+        """ the old key is rejected after the grace period, also if it has been cached """
+        rotate_token(self.token)
+        self.authentication.authenticate_credentials(self.old_key)
+
+        # simulate the end of the grace period
+        cache.delete(get_rotated_cache_key(self.old_key))
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.old_key)
+        with self.assertRaises(AuthenticationFailed):
+            MultiTokenAuthentication().authenticate_credentials(self.old_key)
+
+    @override_settings(AUTH_TOKEN_ROTATION_GRACE_PERIOD=0)
+    def test_without_grace_period(self):
+        """ without a grace period, the old key is rejected immediately """
+        rotate_token(self.token)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.old_key)
+        self.authentication.authenticate_credentials(self.token.key)
+
+    def test_revoke_ends_grace_period(self):
+        """ revoking a token also rejects its rotated keys, also if they have been cached """
+        rotate_token(self.token)
+        self.authentication.authenticate_credentials(self.old_key)
+
+        self.assertTrue(revoke_token(self.token))
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.old_key)
+        with self.assertRaises(AuthenticationFailed):
+            MultiTokenAuthentication().authenticate_credentials(self.old_key)
+
+    def test_delete_ends_grace_period(self):
+        rotate_token(self.token)
+        self.authentication.authenticate_credentials(self.old_key)
+
+        MultiToken.objects.get(pk=self.token.pk).delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.old_key)
+
+    def test_rotate_again_ends_grace_period(self):
+        """ only the key of the latest rotation is within its grace period """
+        rotate_token(self.token)
+        self.authentication.authenticate_credentials(self.old_key)
+        second_key = self.token.key
+        rotate_token(self.token)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.old_key)
+        self.assertEqual(self.authentication.authenticate_credentials(second_key)[1].pk, self.token.pk)
+
+    @override_settings(AUTH_TOKEN_MAX_PER_USER=1)
+    def test_eviction_ends_grace_period(self):
+        """ evicting a token on login also rejects its rotated keys """
+        rotate_token(self.token)
+        self.authentication.authenticate_credentials(self.old_key)
+
+        issue_token(self.user)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.old_key)
+
+    def test_purge_ends_grace_period(self):
+        """ purging an expired token also rejects its rotated keys """
+        rotate_token(self.token)
+        self.authentication.authenticate_credentials(self.old_key)
+
+        MultiToken.objects.filter(pk=self.token.pk).update(expires=timezone.now())
+        call_command('purge_expired_tokens', stdout=StringIO())
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.old_key)
+
+    def test_introspect_old_key_within_grace_period(self):
+        """ introspection reports the old key as active during the grace period, like authentication does """
+        rotate_token(self.token)
+        self.assertEqual(introspect_tokens([self.old_key]), {
+            self.old_key: {'active': True, 'user_id': self.user.pk, 'name': 'ci'},
+        })
+
+        cache.delete(get_rotated_cache_key(self.old_key))
+        self.assertEqual(introspect_tokens([self.old_key]), {self.old_key: {'active': False}})
+
+    def test_rotate_deleted_token(self):
+        """ deleted tokens can't be rotated """
+        MultiToken.objects.all().delete()
+        self.assertIsNone(rotate_token(self.token))
+
+
+class IntrospectTokensTestCase(TestCase):
+    """
+    Test Cases for the introspection of tokens
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.token = MultiToken.objects.create(user=self.user)
+
+    def test_rows_of_other_keys_are_skipped(self):
+        """ rows whose key has not been asked for (e.g. matched by a case insensitive collation) are skipped """
+        key = self.token.key.upper()
+        with patch.object(MultiTokenQuerySet, 'filter_keys', lambda queryset, keys: queryset.all()):
+            self.assertEqual(introspect_tokens([key]), {key: {'active': False}})
+
+
+class IssueLoginTokenTestCase(TestCase):
+    """
+    Test Cases for recording logins
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+
+    def test_issue_login_token(self):
+        """ the last login is updated and the token is created in a single transaction, without saving the user """
+        # SAVEPOINT, UPDATE, INSERT, RELEASE SAVEPOINT (the test runs in a transaction)
+        with self.assertNumQueries(4):
+            token = issue_login_token(self.user, name='login')
+
+        self.assertEqual(token.name, 'login')
+        self.assertIsNotNone(self.user.last_login)
+        self.assertEqual(User.objects.get(pk=self.user.pk).last_login, self.user.last_login)
+
+    def test_issue_login_token_rollback(self):
+        """ the last login is not updated if the token can't be created """
+        with self.assertRaises(TypeError):
+            issue_login_token(self.user, invalid_field='')
+        self.assertIsNone(User.objects.get(pk=self.user.pk).last_login)
+
+    @override_settings(AUTH_UPDATE_LAST_LOGIN=False)
+    def test_without_last_login(self):
+        self.assertFalse(record_last_login(self.user))
+        self.assertIsNone(User.objects.get(pk=self.user.pk).last_login)
+
+    @override_settings(AUTH_LAST_LOGIN_INTERVAL=300)
+    def test_last_login_interval(self):
+        """ the last login is only updated if it is older than the interval """
+        self.assertTrue(record_last_login(self.user))
+        with self.assertNumQueries(0):
+            self.assertFalse(record_last_login(self.user))
+
+        # another login in the meantime
+        recent = timezone.now()
+        User.objects.filter(pk=self.user.pk).update(last_login=recent)
+        self.user.last_login = recent - timedelta(seconds=600)
+        self.assertFalse(record_last_login(self.user))
+        self.assertEqual(User.objects.get(pk=self.user.pk).last_login, recent)
+
+        self.user.last_login = recent - timedelta(seconds=600)
+        User.objects.filter(pk=self.user.pk).update(last_login=self.user.last_login)
+        self.assertTrue(record_last_login(self.user))
+        self.assertGreater(User.objects.get(pk=self.user.pk).last_login, recent)
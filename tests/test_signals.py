@@ -0,0 +1,140 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from drf_multitokenauth.signals import DispatchingSignal, post_auth, signal_dispatcher
+
+
+class DispatchingSignalTestCase(TestCase):
+    """
+    Test Cases for the dispatch modes of the signals
+    """
+    def setUp(self):
+        self.signal = DispatchingSignal()
+        self.calls = []
+        signal_dispatcher.reset_stats()
+
+    def tearDown(self):
+        signal_dispatcher.shutdown()
+
+    def receiver(self, sender, **kwargs):
+        self.calls.append((threading.get_ident(), kwargs['value']))
+        return 'response'
+
+    def test_sync(self):
+        self.signal.connect(self.receiver, weak=False)
+        responses = self.signal.send(sender=None, value=1)
+        self.assertEqual(responses, [(self.receiver, 'response')])
+        self.assertEqual(self.calls, [(threading.get_ident(), 1)])
+
+    @override_settings(AUTH_SIGNAL_DISPATCH='thread')
+    def test_thread(self):
+        """ receivers run in the pool, blocking receivers in the calling thread """
+        blocking_calls = []
+
+        def blocking_receiver(sender, **kwargs):
+            blocking_calls.append(threading.get_ident())
+            return 'blocking'
+
+        self.signal.connect(self.receiver, weak=False)
+        self.signal.connect(blocking_receiver, weak=False, blocking=True)
+        responses = self.signal.send(sender=None, value=1)
+        signal_dispatcher.shutdown()
+
+        self.assertEqual(responses, [(blocking_receiver, 'blocking')])
+        self.assertEqual(blocking_calls, [threading.get_ident()])
+        self.assertEqual(len(self.calls), 1)
+        self.assertNotEqual(self.calls[0][0], threading.get_ident())
+        self.assertEqual(signal_dispatcher.stats(), {
+            'dispatched': 1, 'completed': 1, 'dropped': 0, 'errors': 0, 'pending': 0,
+        })
+
+    @override_settings(AUTH_SIGNAL_DISPATCH='thread', AUTH_SIGNAL_DISPATCH_QUEUE_SIZE=1)
+    def test_queue_full(self):
+        """ sends are dropped if the queue is full """
+        release = threading.Event()
+
+        def slow_receiver(sender, **kwargs):
+            release.wait(5)
+            self.calls.append(kwargs['value'])
+
+        self.signal.connect(slow_receiver, weak=False)
+        self.signal.send(sender=None, value=1)
+        with self.assertLogs('drf_multitokenauth.signals', 'WARNING'):
+            self.signal.send(sender=None, value=2)
+        release.set()
+        signal_dispatcher.shutdown()
+
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(signal_dispatcher.stats()['dropped'], 1)
+
+        # the queue accepts sends again
+        self.signal.send(sender=None, value=3)
+        signal_dispatcher.shutdown()
+        self.assertEqual(self.calls, [1, 3])
+
+    @override_settings(AUTH_SIGNAL_DISPATCH='thread')
+    def test_receiver_errors(self):
+        def failing_receiver(sender, **kwargs):
+            raise ValueError('failed')
+
+        self.signal.connect(failing_receiver, weak=False)
+        self.signal.connect(self.receiver, weak=False)
+        with self.assertLogs('drf_multitokenauth.signals', 'ERROR'):
+            self.signal.send(sender=None, value=1)
+            signal_dispatcher.shutdown()
+
+        # other receivers still run
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(signal_dispatcher.stats()['errors'], 1)
+
+    @override_settings(AUTH_SIGNAL_DISPATCH='on_commit')
+    def test_on_commit(self):
+        self.signal.connect(self.receiver, weak=False)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.signal.send(sender=None, value=1)
+        self.assertEqual(self.calls, [])
+
+        callbacks[0]()
+        signal_dispatcher.shutdown()
+        self.assertEqual([value for thread, value in self.calls], [1])
+
+    def test_disconnect(self):
+        self.signal.connect(self.receiver, weak=False, blocking=True)
+        self.assertTrue(self.signal.has_listeners())
+        self.assertTrue(self.signal.disconnect(self.receiver))
+        self.assertFalse(self.signal.has_listeners())
+
+    @override_settings(AUTH_SIGNAL_DISPATCH='queue')
+    def test_invalid_mode(self):
+        self.signal.connect(self.receiver, weak=False)
+        with self.assertRaises(ImproperlyConfigured):
+            self.signal.send(sender=None, value=1)
+
+
+@override_settings(AUTH_SIGNAL_DISPATCH='thread')
+class DispatchedLoginSignalsTestCase(APITestCase):
+    """
+    Test Cases for the login view with dispatched signals
+    """
+    def setUp(self):
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+
+    def test_login(self):
+        receiver = mock.Mock()
+        post_auth.connect(receiver, weak=False)
+        self.addCleanup(post_auth.disconnect, receiver)
+
+        response = self.client.post(
+            reverse('multi_token_auth:auth-login'), {'username': 'user1', 'password': 'secret1'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        signal_dispatcher.shutdown()
+        self.assertEqual(receiver.call_count, 1)
+        self.assertEqual(receiver.call_args.kwargs['user'], self.user)
@@ -0,0 +1,115 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from drf_multitokenauth.models import MultiToken
+from drf_multitokenauth.throttling import LoginRateThrottle
+
+
+@override_settings(AUTH_LOGIN_THROTTLE_RATES={'username': '3/min', 'ip': '5/min'})
+class LoginRateThrottleTestCase(TestCase):
+    """
+    Test Cases for the sliding window login throttle
+    """
+    def setUp(self):
+        cache.clear()
+        self.throttle = LoginRateThrottle()
+
+    def test_throttle_by_username(self):
+        """ usernames are throttled case insensitively """
+        for username in ('user1', 'User1', 'USER1'):
+            self.assertTrue(self.throttle.allow_attempt(username, '10.0.0.1'))
+        self.assertFalse(self.throttle.allow_attempt('user1', '10.0.0.2'))
+        self.assertGreater(self.throttle.wait(), 0)
+        self.assertLessEqual(self.throttle.wait(), 60)
+
+        # other users are not throttled
+        self.assertTrue(self.throttle.allow_attempt('user2', '10.0.0.2'))
+
+    def test_throttle_by_ip(self):
+        for i in range(5):
+            self.assertTrue(self.throttle.allow_attempt('user{}'.format(i), '10.0.0.1'))
+        self.assertFalse(self.throttle.allow_attempt('user9', '10.0.0.1'))
+        self.assertTrue(self.throttle.allow_attempt('user9', '10.0.0.2'))
+
+    def test_rejected_attempts_are_not_counted(self):
+        for i in range(3):
+            self.throttle.allow_attempt('user1', '10.0.0.1')
+        for i in range(5):
+            self.assertFalse(self.throttle.allow_attempt('user1', '10.0.0.1'))
+        # the ip has only been used for 3 accepted attempts
+        self.assertTrue(self.throttle.allow_attempt('user2', '10.0.0.1'))
+        self.assertTrue(self.throttle.allow_attempt('user3', '10.0.0.1'))
+
+    def test_sliding_window(self):
+        """ attempts of the previous window are weighted by the part of it which is still in the sliding window """
+        with mock.patch('drf_multitokenauth.throttling.time.time', return_value=600.0):
+            for i in range(3):
+                self.assertTrue(self.throttle.allow_attempt('user1', None))
+
+        # half of the previous window is still covered: 3 * 0.5 = 1.5 attempts
+        with mock.patch('drf_multitokenauth.throttling.time.time', return_value=690.0):
+            self.assertTrue(self.throttle.allow_attempt('user1', None))
+            self.assertTrue(self.throttle.allow_attempt('user1', None))
+            self.assertFalse(self.throttle.allow_attempt('user1', None))
+            self.assertEqual(self.throttle.wait(), 30)
+
+        # the window of 600 - 660 has slid out
+        with mock.patch('drf_multitokenauth.throttling.time.time', return_value=750.0):
+            self.assertTrue(self.throttle.allow_attempt('user1', None))
+
+    def test_concurrent_attempts(self):
+        """ attempts which have all read the counters before any of them has been counted can't exceed the limit """
+        with mock.patch.object(cache, 'get_many', return_value={}):
+            allowed = [self.throttle.allow_attempt('user1', '10.0.0.{}'.format(i)) for i in range(5)]
+        self.assertEqual(allowed, [True, True, True, False, False])
+
+    def test_rejected_attempt_costs_one_cache_round_trip(self):
+        for i in range(3):
+            self.throttle.allow_attempt('user1', '10.0.0.1')
+
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many, \
+                mock.patch.object(cache, 'incr', wraps=cache.incr) as incr:
+            self.assertFalse(self.throttle.allow_attempt('user1', '10.0.0.1'))
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(incr.call_count, 0)
+
+    @override_settings(AUTH_LOGIN_THROTTLE_RATES={})
+    def test_disabled(self):
+        with mock.patch.object(cache, 'get_many') as get_many:
+            for i in range(10):
+                self.assertTrue(self.throttle.allow_attempt('user1', '10.0.0.1'))
+        get_many.assert_not_called()
+
+
+@override_settings(AUTH_LOGIN_THROTTLE_RATES={'username': '2/min'})
+class LoginThrottleViewTestCase(APITestCase):
+    """
+    Test Cases for throttled login views
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+
+    def assert_login_throttled(self, url, **kwargs):
+        for i in range(2):
+            response = self.client.post(url, {'username': 'user1', 'password': 'wrong'}, **kwargs)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with mock.patch('rest_framework.authtoken.serializers.authenticate') as authenticate:
+            response = self.client.post(url, {'username': 'user1', 'password': 'secret1'}, **kwargs)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        authenticate.assert_not_called()
+        self.assertEqual(MultiToken.objects.count(), 0)
+
+    def test_login_throttled(self):
+        self.assert_login_throttled(reverse('multi_token_auth:auth-login'), format='json')
+
+    def test_async_login_throttled(self):
+        self.assert_login_throttled(reverse('async-auth-login'), content_type='application/json')
@@ -0,0 +1,156 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from drf_multitokenauth.coreauthentication import (
+    CachedMultiTokenAuthentication, DualReadMultiTokenAuthentication, MultiTokenAuthentication
+)
+from drf_multitokenauth.models import MultiToken
+from drf_multitokenauth.usage import UsageTracker
+
+
+@override_settings(AUTH_TOKEN_TRACK_USAGE=True, AUTH_TOKEN_USAGE_INTERVAL=60, AUTH_TOKEN_USAGE_BATCH_SIZE=100)
+class UsageTrackingTestCase(TestCase):
+    """
+    Test Cases for the write-behind tracking of token usage
+    """
+    def setUp(self):
+        cache.clear()
+        self.tracker = UsageTracker()
+        patcher = patch('drf_multitokenauth.coreauthentication.usage_tracker', self.tracker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.token = MultiToken.objects.create(user=self.user, user_agent="old agent")
+
+    def authenticate(self, authentication_class=MultiTokenAuthentication, REMOTE_ADDR='10.0.0.1'):
+        request = APIRequestFactory().get(
+            '/', HTTP_AUTHORIZATION='Token ' + self.token.key, HTTP_USER_AGENT='new agent', REMOTE_ADDR=REMOTE_ADDR
+        )
+        return authentication_class().authenticate(request)
+
+    def test_legacy_tokens_are_not_recorded(self):
+        """ legacy tokens of DualReadMultiTokenAuthentication are not tracked """
+        legacy_token = Token.objects.create(user=self.user)
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='Token ' + legacy_token.key)
+
+        self.assertEqual(DualReadMultiTokenAuthentication().authenticate(request), (self.user, legacy_token))
+        self.authenticate(DualReadMultiTokenAuthentication)
+        self.tracker.flush()
+
+        self.token.refresh_from_db()
+        self.assertIsNotNone(self.token.last_used)
+
+    def test_usage_is_buffered(self):
+        """ usage is written to the database when the buffer is flushed """
+        self.authenticate()
+        self.token.refresh_from_db()
+        self.assertIsNone(self.token.last_used)
+
+        self.tracker.flush()
+        self.token.refresh_from_db()
+        self.assertIsNotNone(self.token.last_used)
+        self.assertEqual(self.token.last_known_ip, '10.0.0.1')
+        self.assertEqual(self.token.user_agent, 'new agent')
+
+    @override_settings(AUTH_TOKEN_USAGE_BATCH_SIZE=1)
+    def test_full_buffer_is_flushed(self):
+        """ the buffer is flushed in the background as soon as AUTH_TOKEN_USAGE_BATCH_SIZE tokens are pending """
+        with patch.object(self.tracker, 'flush_in_background') as flush_in_background, self.assertNumQueries(1):
+            # the lookup of the token, but no update
+            self.authenticate()
+        flush_in_background.assert_called_once_with()
+
+    def test_failed_flush_keeps_transaction_usable(self):
+        """ a failed flush within a transaction (e.g. ATOMIC_REQUESTS) does not break the transaction """
+        self.authenticate()
+
+        with transaction.atomic():
+            with patch.object(QuerySet, 'bulk_update', side_effect=DatabaseError), \
+                    self.assertLogs('drf_multitokenauth.usage', 'ERROR'):
+                self.tracker.flush()
+            self.assertTrue(MultiToken.objects.filter(pk=self.token.pk).exists())
+
+    async def test_async_usage_is_recorded(self):
+        """ usage is recorded in the event loop by async authentication, instead of running record in a thread """
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='Token ' + self.token.key, HTTP_USER_AGENT='agent')
+        with patch.object(self.tracker, 'record', side_effect=AssertionError):
+            await self.tracker.arecord(self.token, request)
+
+        self.assertEqual(list(self.tracker._pending), [self.token.pk])
+
+    def test_usage_is_debounced(self):
+        """ usage is recorded at most once per token and interval """
+        self.authenticate()
+        self.tracker.flush()
+
+        with self.assertNumQueries(1):
+            # the lookup of the token, but no update
+            self.authenticate(REMOTE_ADDR='10.0.0.2')
+        self.tracker.flush()
+
+        self.token.refresh_from_db()
+        self.assertEqual(self.token.last_known_ip, '10.0.0.1')
+
+    def test_usage_is_debounced_across_processes(self):
+        """ usage recorded by another process (with the same cache) is not recorded again """
+        self.authenticate()
+        other_tracker = UsageTracker()
+
+        with patch('drf_multitokenauth.coreauthentication.usage_tracker', other_tracker):
+            self.authenticate()
+
+        self.assertEqual(other_tracker._pending, {})
+
+    def test_cached_authentication_records_usage(self):
+        """ usage is recorded for cache hits as well """
+        self.authenticate(CachedMultiTokenAuthentication)
+        self.tracker.flush()
+        MultiToken.objects.filter(pk=self.token.pk).update(last_used=None)
+        cache.delete('drf_multitokenauth:used:{}'.format(self.token.pk))
+        self.tracker._recorded.clear()
+
+        with self.assertNumQueries(0):
+            self.authenticate(CachedMultiTokenAuthentication)
+        self.tracker.flush()
+
+        self.token.refresh_from_db()
+        self.assertIsNotNone(self.token.last_used)
+
+    @override_settings(AUTH_TOKEN_TRACK_USAGE=False)
+    def test_usage_tracking_disabled(self):
+        """ without AUTH_TOKEN_TRACK_USAGE, no usage is recorded """
+        self.authenticate()
+        self.tracker.flush()
+
+        self.token.refresh_from_db()
+        self.assertIsNone(self.token.last_used)
+
+
+@override_settings(AUTH_TOKEN_TRACK_USAGE=True, AUTH_TOKEN_USAGE_INTERVAL=60, AUTH_TOKEN_USAGE_BATCH_SIZE=1)
+class BackgroundFlushTestCase(TransactionTestCase):
+    """
+    Test Cases for flushing token usage in a background thread
+    """
+    def setUp(self):
+        cache.clear()
+        self.tracker = UsageTracker()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+        self.token = MultiToken.objects.create(user=self.user)
+
+    def test_background_flush(self):
+        """ a full buffer is written by a background thread """
+        request = APIRequestFactory().get('/', REMOTE_ADDR='10.0.0.1')
+        self.tracker.record(self.token, request)
+        self.tracker.join(5)
+
+        self.token.refresh_from_db()
+        self.assertIsNotNone(self.token.last_used)
+        self.assertEqual(self.token.last_known_ip, '10.0.0.1')
@@ -0,0 +1,95 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from drf_multitokenauth import models
+from drf_multitokenauth.models import MultiToken, UserAgent
+from drf_multitokenauth.services import issue_token
+
+
+@override_settings(AUTH_TOKEN_NORMALIZE_USER_AGENT=True)
+class UserAgentTestCase(TestCase):
+    """
+    Test Cases for normalized user agents
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        models.user_agent_ids.clear()
+        models.user_agent_values.clear()
+        self.user = User.objects.create_user("user1", "user1@mail.com", "secret1")
+
+    def test_user_agents_are_interned(self):
+        """ user agents are stored once, and referenced by tokens """
+        with self.captureOnCommitCallbacks(execute=True):
+            token1 = MultiToken.objects.create(user=self.user, user_agent='agent')
+
+        # the user agent is cached now
+        with self.assertNumQueries(1):
+            token2 = MultiToken.objects.create(user=self.user, user_agent='agent')
+
+        self.assertEqual(UserAgent.objects.count(), 1)
+        self.assertEqual(token1.user_agent_ref_id, token2.user_agent_ref_id)
+        self.assertEqual(MultiToken.objects.get(pk=token1.pk).user_agent, '')
+        self.assertEqual(MultiToken.objects.get(pk=token1.pk).get_user_agent(), 'agent')
+        # the user agent remains available on the created instance
+        self.assertEqual(token1.user_agent, 'agent')
+
+    def test_rolled_back_user_agents_are_not_cached(self):
+        """ user agents created in a transaction are only cached after it has been committed """
+        MultiToken.objects.create(user=self.user, user_agent='agent')
+        self.assertEqual(models.user_agent_ids, {})
+
+    def test_empty_user_agent(self):
+        """ empty user agents are not interned """
+        token = MultiToken.objects.create(user=self.user)
+        self.assertIsNone(token.user_agent_ref_id)
+        self.assertEqual(token.get_user_agent(), '')
+
+    def test_unsaved_tokens_are_not_interned(self):
+        """ user agents are interned when a token is saved, not when it is instantiated """
+        with self.assertNumQueries(0):
+            token = MultiToken(user=self.user, user_agent='agent')
+        self.assertIsNone(token.user_agent_ref_id)
+        self.assertEqual(UserAgent.objects.count(), 0)
+
+    def test_user_agents_are_interned_on_the_database_of_the_token(self):
+        """ user agents are interned on the database the token is saved to """
+        User.objects.using('replica').bulk_create([self.user])
+        MultiToken.objects.using('replica').create(user=self.user, user_agent='agent')
+
+        self.assertEqual(UserAgent.objects.using('replica').get().value, 'agent')
+        self.assertFalse(UserAgent.objects.exists())
+
+    @override_settings(AUTH_TOKEN_NORMALIZE_USER_AGENT=False)
+    def test_filter_by_field(self):
+        """ without normalization, the user agent is a plain field which can be used in queries """
+        token = MultiToken.objects.create(user=self.user, user_agent='agent')
+        self.assertEqual(list(MultiToken.objects.filter(user_agent='agent')), [token])
+
+    def test_reuse_token(self):
+        """ tokens are reused by their normalized user agent, as well as by user agents which are stored inline """
+        with override_settings(AUTH_TOKEN_NORMALIZE_USER_AGENT=False):
+            inline_token = issue_token(self.user, name='inline', user_agent='agent')
+        normalized_token = issue_token(self.user, name='normalized', user_agent='agent')
+
+        self.assertEqual(issue_token(self.user, reuse=True, name='inline', user_agent='agent'), inline_token)
+        self.assertEqual(issue_token(self.user, reuse=True, name='normalized', user_agent='agent'), normalized_token)
+
+    def test_normalize_user_agents(self):
+        """ the management command moves existing user agents into the UserAgent table """
+        with override_settings(AUTH_TOKEN_NORMALIZE_USER_AGENT=False):
+            tokens = [MultiToken.objects.create(user=self.user, user_agent='agent {}'.format(i % 2)) for i in range(5)]
+            empty_token = MultiToken.objects.create(user=self.user)
+
+        out = StringIO()
+        call_command('normalize_user_agents', batch_size=2, stdout=out)
+
+        self.assertIn('Normalized 5 user agents', out.getvalue())
+        self.assertEqual(UserAgent.objects.count(), 2)
+        self.assertFalse(MultiToken.objects.exclude(user_agent='').exists())
+        for i, token in enumerate(tokens):
+            self.assertEqual(MultiToken.objects.get(pk=token.pk).get_user_agent(), 'agent {}'.format(i % 2))
+        self.assertIsNone(MultiToken.objects.get(pk=empty_token.pk).user_agent_ref_id)
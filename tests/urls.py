@@ -1,7 +1,16 @@
 """ Tests App URL Config """
 from django.conf.urls import include
+from django.contrib import admin
 from django.urls import re_path
 
+from drf_multitokenauth.views import (
+    async_login_and_obtain_auth_token, async_logout_and_delete_auth_token, export_auth_tokens
+)
+
 urlpatterns = [
+    re_path(r'^admin/', admin.site.urls),
     re_path(r'^api/auth/', include('drf_multitokenauth.urls', namespace='multi_token_auth')),
+    re_path(r'^api/async-auth/login', async_login_and_obtain_auth_token, name='async-auth-login'),
+    re_path(r'^api/async-auth/logout', async_logout_and_delete_auth_token, name='async-auth-logout'),
+    re_path(r'^api/auth-export/', export_auth_tokens, name='auth-export'),
 ]